@@ -1,12 +1,86 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, url_for, g, Response
 import os
+import io
 import json
+import logging
 from datetime import datetime
-from utils.pdf_generator import PDFGenerator
+from werkzeug.exceptions import BadRequest
+from utils.pdf_generator import PDFGenerator, packet_filename
+from utils.switchboard import parse_switchboard
+from utils.material_summary import summary_csv, summary_json
+from utils.batch import generate_batch, merge_pdfs, zip_packets, normalize_board
+from utils.packet_cache import PacketCache
+from utils.packet_jobs import JobStore, JobQueue, JOB_DONE
+from utils.metrics import REGISTRY, Counter, Histogram, CallbackMetric
+from utils.logging_setup import configure_logging, set_request_id
 import time
 
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Packet warnings listed in the X-Packet-Warning-Summary response header
+MAX_WARNINGS_IN_HEADER = 20
+
 app = Flask(__name__)
-pdf_generator = PDFGenerator()
+pdf_generator = PDFGenerator(check_images=True)
+packet_cache = PacketCache(
+    os.path.join(pdf_generator.output_dir, 'packet_cache'),
+    pdf_generator.images_dir,
+    max_bytes=int(os.environ.get('PACKET_CACHE_MAX_BYTES', 500 * 1024 * 1024)),
+    rules_fingerprint=lambda: pdf_generator.bom_rules.current().fingerprint,
+    packet_quality=pdf_generator.get_quality
+)
+job_queue = JobQueue(
+    pdf_generator,
+    JobStore(os.path.join(pdf_generator.output_dir, 'jobs.sqlite3')),
+    max_workers=int(os.environ.get('PACKET_JOB_WORKERS', 2)),
+    retention=float(os.environ.get('PACKET_JOB_RETENTION_SECONDS', 24 * 60 * 60))
+)
+
+HTTP_REQUESTS = Counter('http_requests_total', 'HTTP requests handled', ['endpoint', 'method', 'status'])
+HTTP_SECONDS = Histogram('http_request_duration_seconds', 'Time to handle HTTP requests', ['endpoint', 'method'])
+
+def cache_stats():
+    return {'image': pdf_generator.image_cache.stats(), 'packet': packet_cache.stats()}
+
+CallbackMetric('cache_hits_total', 'Cache lookups that found an entry', 'counter',
+               lambda: [({'cache': name}, stats['hits']) for name, stats in cache_stats().items()])
+CallbackMetric('cache_misses_total', 'Cache lookups that found nothing', 'counter',
+               lambda: [({'cache': name}, stats['misses']) for name, stats in cache_stats().items()])
+CallbackMetric('cache_hit_ratio', 'Fraction of cache lookups that were hits', 'gauge',
+               lambda: [({'cache': name}, stats['hit_rate']) for name, stats in cache_stats().items()])
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    # Reuse the caller's correlation id (e.g. from a proxy) or start a new one
+    g.request_id = set_request_id(request.headers.get('X-Request-ID'))
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.get('request_start')
+    if start is not None:
+        # Unmatched URLs have no endpoint; keep them under one label
+        endpoint = request.endpoint or 'unknown'
+        HTTP_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, method=request.method)
+        HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
+def add_warning_headers(response, warnings):
+    """Summarize packet warnings for clients that only see the download."""
+    unique_warnings = list(dict.fromkeys(warnings))
+    response.headers['X-Packet-Warnings'] = str(len(warnings))
+    if unique_warnings:
+        response.headers['X-Packet-Warning-Summary'] = ' | '.join(unique_warnings[:MAX_WARNINGS_IN_HEADER])
+    return response
+
+@app.before_request
+def resume_packet_jobs():
+    # Resumed from the serving process rather than at import, so a preloading
+    # WSGI server doesn't start job threads in its master before forking
+    job_queue.ensure_recovered()
 
 @app.route('/')
 def index():
@@ -16,29 +90,157 @@ def index():
 def generate_pdf():
     try:
         form_data = request.form.to_dict()
+        # Reject a board that won't parse before looking it up or rendering it
+        parse_switchboard(form_data)
         form_data['timestamp'] = time.strftime("%Y%m%d_%H%M%S")
         
-        # Generate the PDF
-        pdf_path = pdf_generator.generate_pdf(form_data)
+        # Serve a previously generated packet for the same board if we have one
+        cache_status = 'BYPASS'
+        pdf_path = None
+        warnings = []
+        if packet_cache.enabled:
+            cache_key = packet_cache.key_for(form_data)
+            pdf_path = packet_cache.get(cache_key)
+            cache_status = 'HIT' if pdf_path else 'MISS'
+            if pdf_path:
+                warnings = packet_cache.warnings_for(cache_key)
+        
+        # Generate the PDF in memory and stream it back, keeping a copy in the cache
+        pdf_file = pdf_path
+        if pdf_path is None:
+            pdf_file = pdf_generator.generate_pdf_stream(form_data, warnings=warnings)
+            if packet_cache.enabled:
+                packet_cache.put_stream(cache_key, pdf_file, warnings)
         
         # Create a formatted filename with Sales Order, Customer Name, and Switchboard Name
-        sales_order = form_data.get('sales_order', 'Unknown')
-        customer_name = form_data.get('customer_name', 'Unknown')
-        switchboard_name = form_data.get('switchboard_name', 'Unknown')
+        download_name = packet_filename(form_data)
+        
+        # Return the PDF file
+        response = send_file(pdf_file, mimetype='application/pdf', as_attachment=True, download_name=download_name)
+        response.headers['X-Packet-Cache'] = cache_status
+        if packet_cache.enabled:
+            response.headers['X-Packet-Cache-Key'] = cache_key
+        return add_warning_headers(response, warnings)
+    except ValueError as e:
+        # Malformed configuration, e.g. a non-numeric section count
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.exception("Error generating packet: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/preview', methods=['POST'])
+def preview_packet():
+    """Dry run of /generate_pdf: page counts, images and estimated size, without rendering."""
+    try:
+        form_data = request.get_json(silent=True) or request.form.to_dict()
+        if not isinstance(form_data, dict):
+            raise ValueError('Switchboard definition must be an object')
+        result = pdf_generator.preview_packet(form_data)
+        result['success'] = True
+        return jsonify(result)
+    except ValueError as e:
+        # Malformed configuration, e.g. a non-numeric section count
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.exception("Error previewing packet: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/material_summary', methods=['POST'])
+def material_summary():
+    """The board's parts totalled across sections, as CSV or JSON (?format=csv|json)."""
+    try:
+        form_data = request.get_json(silent=True) or request.form.to_dict()
+        if not isinstance(form_data, dict):
+            raise ValueError('Switchboard definition must be an object')
+        board = pdf_generator.get_switchboard(form_data)
+        rows = pdf_generator.material_summary(board)
+        output_format = request.args.get('format', 'json')
+        if output_format == 'csv':
+            return send_file(io.BytesIO(summary_csv(rows).encode('utf-8')), mimetype='text/csv', as_attachment=True,
+                             download_name=packet_filename(board, 'Material Summary', 'csv'))
+        return Response(summary_json(rows, board), mimetype='application/json')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.exception("Error building material summary: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/generate_batch', methods=['POST'])
+def generate_batch_packets():
+    try:
+        data = request.get_json(force=True)
+        boards = data.get('boards', []) if isinstance(data, dict) else data
+        if not boards:
+            return jsonify({'error': 'No switchboards in batch'}), 400
+        if not isinstance(boards, list):
+            return jsonify({'error': 'Switchboards must be given as a list'}), 400
+        boards = [normalize_board(board) for board in boards]
+        output_format = data.get('format', 'pdf') if isinstance(data, dict) else 'pdf'
         
-        # Clean the values to make them safe for filenames
-        sales_order = ''.join(c for c in sales_order if c.isalnum() or c in ' -_')
-        customer_name = ''.join(c for c in customer_name if c.isalnum() or c in ' -_')
-        switchboard_name = ''.join(c for c in switchboard_name if c.isalnum() or c in ' -_')
+        warnings = []
+        pdfs = generate_batch(boards, pdf_generator=pdf_generator, warnings=warnings)
         
-        # Create the formatted filename
-        download_name = f"{sales_order} - {customer_name} - {switchboard_name} - Factory Packet.pdf"
+        sales_order = ''.join(c for c in boards[0].get('sales_order', 'Unknown') if c.isalnum() or c in ' -_')
+        if output_format == 'zip':
+            response = send_file(io.BytesIO(zip_packets(boards, pdfs)), mimetype='application/zip',
+                                 as_attachment=True, download_name=f"{sales_order} - Factory Packets.zip")
+        else:
+            response = send_file(io.BytesIO(merge_pdfs(pdfs)), mimetype='application/pdf',
+                                 as_attachment=True, download_name=f"{sales_order} - Factory Packets.pdf")
+        return add_warning_headers(response, warnings)
+    except (BadRequest, ValueError) as e:
+        # Invalid JSON or a board that doesn't parse
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.exception("Error generating batch: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    try:
+        form_data = request.get_json() if request.is_json else request.form.to_dict()
+        if not isinstance(form_data, dict):
+            raise ValueError('Switchboard definition must be an object')
+        # Reject a board that won't parse now rather than queueing a job that fails
+        parse_switchboard(form_data)
+        form_data['timestamp'] = time.strftime("%Y%m%d_%H%M%S")
         
-        # Return the PDF file
-        return send_file(pdf_path, as_attachment=True, download_name=download_name)
+        job_id = job_queue.submit(form_data)
+        logger.info("Queued packet job %s", job_id)
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': url_for('job_status', job_id=job_id)
+        }), 202
+    except (BadRequest, ValueError) as e:
+        # Invalid JSON or a board that doesn't parse
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
+        logger.exception("Error queueing packet job: %s", e)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'message': f'Unknown job: {job_id}'
+        }), 404
+    
+    result = {
+        'success': True,
+        'job_id': job_id,
+        'status': job['status'],
+        'sections_done': job['sections_done'],
+        'total_sections': job['total_sections'],
+        'error': job['error'],
+        'warnings': job['warnings']
+    }
+    if job['status'] == JOB_DONE:
+        result['download_url'] = url_for('download', filename=job['filename'])
+    return jsonify(result)
+
 @app.route('/download/<filename>')
 def download(filename):
     try:
@@ -52,5 +254,9 @@ def download(filename):
             'message': str(e)
         }), 404
 
+@app.route('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
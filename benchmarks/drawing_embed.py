@@ -0,0 +1,110 @@
+"""Time raster drawing embedding in process_drawings with and without temp PNG files.
+
+Usage: python benchmarks/drawing_embed.py [--parts 50] [--drawings 5] [--lines 2000] [--runs 3]
+
+Builds an assembly of --parts parts that share --drawings synthetic DXF
+drawings, then compares the old per-part round trip (PNG encode, temp file
+write, drawImage from the path, unlink) with process_drawings(mode='raster'),
+which hands the in-memory image to the canvas. A warm-up run fills the
+raster cache first; both variants then take every drawing from it (the
+prefetch only starts workers for cache misses), so the difference is the
+embedding cost alone.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ezdxf
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+from utils.drawing_processor import convert_dwg_to_image, process_drawings
+
+
+def build_drawings(num_drawings, num_lines):
+    """Write num_drawings random line drawings to drawings/ in the current directory."""
+    os.makedirs('drawings', exist_ok=True)
+    rng = random.Random(0)
+    for index in range(num_drawings):
+        doc = ezdxf.new()
+        msp = doc.modelspace()
+        for _ in range(num_lines):
+            msp.add_line((rng.uniform(0, 400), rng.uniform(0, 150)), (rng.uniform(0, 400), rng.uniform(0, 150)))
+        doc.saveas(os.path.join('drawings', f'part_{index}.dwg'))
+
+
+def build_assembly(num_parts, num_drawings):
+    parts = [
+        {'name': f'Part {i}', 'quantity': 1, 'drawing': f'part_{i % num_drawings}'}
+        for i in range(num_parts)
+    ]
+    return [{'name': 'Benchmark Assembly', 'quantity': 1, 'parts': parts}]
+
+
+def process_drawings_temp_png(assemblies, output_file):
+    """The previous raster loop: every part goes through a temporary PNG file."""
+    c = canvas.Canvas(output_file, pagesize=letter)
+    for assembly in assemblies:
+        y_position = 700
+        for part in assembly['parts']:
+            image = convert_dwg_to_image(os.path.join('drawings', f"{part['drawing']}.dwg"))
+            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
+                image.save(tmp.name)
+                c.drawString(50, y_position, f"Part: {part['name']}")
+                c.drawImage(tmp.name, 50, y_position - 220, width=500, height=180)
+                os.unlink(tmp.name)
+            y_position -= 250
+            if y_position < 100:
+                c.showPage()
+                y_position = 700
+        c.showPage()
+    c.save()
+    return output_file
+
+
+def best_of(runs, func):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output_file = func()
+        timings.append(time.perf_counter() - start)
+        os.unlink(output_file)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--parts', type=int, default=50)
+    parser.add_argument('--drawings', type=int, default=5)
+    parser.add_argument('--lines', type=int, default=2000)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        os.makedirs('output')
+        build_drawings(args.drawings, args.lines)
+        assemblies = build_assembly(args.parts, args.drawings)
+
+        # Warm the raster cache so both variants start from rasterized drawings
+        process_drawings(assemblies, mode='raster')
+
+        results = {
+            'temp_png': best_of(args.runs, lambda: process_drawings_temp_png(assemblies, 'output/temp_png.pdf')),
+            'in_memory': best_of(args.runs, lambda: process_drawings(assemblies, mode='raster'))
+        }
+
+    print(f"{args.parts} parts sharing {args.drawings} drawings, best of {args.runs} runs")
+    print(f"{'variant':<10} {'seconds':>9} {'ms/part':>9}")
+    for name, seconds in results.items():
+        print(f"{name:<10} {seconds:>9.3f} {seconds * 1000 / args.parts:>9.2f}")
+    saving = (results['temp_png'] - results['in_memory']) * 1000 / args.parts
+    print(f"saving: {saving:.2f} ms/part ({results['temp_png'] / results['in_memory']:.1f}x faster)")
+
+
+if __name__ == '__main__':
+    main()
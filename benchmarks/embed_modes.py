@@ -0,0 +1,72 @@
+"""Compare packet size and render time for the 'inline' and 'shared' image embed modes.
+
+Usage: python benchmarks/embed_modes.py [--sections 30] [--runs 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.pdf_generator import PDFGenerator
+
+
+def build_form_data(num_sections):
+    """A Spectra lineup with a couple of MLO sections mixed in."""
+    form_data = {
+        'sales_order': 'BENCH-001',
+        'customer_name': 'Benchmark',
+        'job_address': 'Benchmark Job',
+        'switchboard_name': 'SWBD-1',
+        'num_sections': str(num_sections),
+        'common_depth': '30',
+        'common_height': '90',
+        'common_amperage': '4000',
+        'common_bus': '4'
+    }
+    for i in range(1, num_sections + 1):
+        section_type = 'MLO' if i % 10 == 5 else 'Spectra'
+        form_data[f'section_type_{i}'] = section_type
+        form_data[f'width_{i}'] = '36' if section_type == 'MLO' else '44'
+    return form_data
+
+
+def run(generator, form_data, embed_mode, runs):
+    timings = []
+    size = 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        pdf_path = generator.generate_pdf(form_data, embed_mode=embed_mode)
+        timings.append(time.perf_counter() - start)
+        size = os.path.getsize(pdf_path)
+        os.unlink(pdf_path)
+    return min(timings), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sections', type=int, default=30)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    generator = PDFGenerator()
+    form_data = build_form_data(args.sections)
+
+    # Warm the image cache so both modes start from decoded images
+    run(generator, form_data, 'inline', 1)
+
+    results = {mode: run(generator, form_data, mode, args.runs) for mode in ('inline', 'shared')}
+
+    print(f"{args.sections}-section packet, best of {args.runs} runs")
+    print(f"{'mode':<8} {'seconds':>9} {'bytes':>12}")
+    for mode, (seconds, size) in results.items():
+        print(f"{mode:<8} {seconds:>9.3f} {size:>12,}")
+
+    inline_seconds, inline_size = results['inline']
+    shared_seconds, shared_size = results['shared']
+    print(f"shared/inline: time {shared_seconds / inline_seconds:.2f}x, size {shared_size / inline_size:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
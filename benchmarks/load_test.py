@@ -0,0 +1,152 @@
+"""Load test /generate_pdf and report requests per second.
+
+Usage:
+    python benchmarks/load_test.py --url http://localhost:5000 [--concurrency 8] [--duration 15]
+    python benchmarks/load_test.py --compare
+
+--compare starts the Flask dev server (as the Dockerfile runs it) and the
+gunicorn production profile on local ports, with the packet cache disabled
+so every request renders, and prints both results side by side.
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.embed_modes import build_form_data
+
+
+def run_load(url, concurrency, duration, num_sections):
+    """Hammer url/generate_pdf from concurrency threads for duration seconds."""
+    form_data = build_form_data(num_sections)
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(worker_id):
+        request_number = 0
+        while time.perf_counter() < deadline:
+            request_number += 1
+            # Vary the customer so a packet cache in front of the renderer can't answer
+            body = dict(form_data, customer_name=f"Load {worker_id}-{request_number}")
+            data = urllib.parse.urlencode(body).encode('utf-8')
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(f"{url}/generate_pdf", data=data, timeout=120) as response:
+                    response.read()
+                    ok = response.status == 200
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] if latencies else 0.0
+
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': len(latencies) / wall,
+        'p50': percentile(0.5),
+        'p95': percentile(0.95)
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=2):
+                return
+        except Exception:
+            time.sleep(0.25)
+    raise RuntimeError(f"Server at {url} did not start")
+
+
+def start_server(profile, port):
+    env = dict(os.environ, PACKET_CACHE_MAX_BYTES='0', PYTHONUNBUFFERED='1')
+    if profile == 'dev':
+        env.update(FLASK_APP='app.py', FLASK_DEBUG='1')
+        command = [sys.executable, '-m', 'flask', 'run', '--host=127.0.0.1', f'--port={port}', '--debugger']
+    else:
+        env.update(FLASK_DEBUG='0', BIND=f'127.0.0.1:{port}')
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app']
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            start_new_session=True)
+
+
+def stop_server(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+    except Exception:
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+def print_results(results):
+    print(f"{'server':<10} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 s':>8} {'p95 s':>8}")
+    for name, r in results.items():
+        print(f"{name:<10} {r['requests']:>9} {r['errors']:>7} {r['rps']:>8.2f} {r['p50']:>8.3f} {r['p95']:>8.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test packet generation.')
+    parser.add_argument('--url', help='Base URL of a running server')
+    parser.add_argument('--compare', action='store_true', help='Start and compare the dev server and gunicorn')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--sections', type=int, default=10)
+    args = parser.parse_args()
+
+    if not args.compare:
+        if not args.url:
+            parser.error('--url or --compare is required')
+        print_results({args.url: run_load(args.url.rstrip('/'), args.concurrency, args.duration, args.sections)})
+        return
+
+    results = {}
+    for profile in ('dev', 'gunicorn'):
+        port = free_port()
+        process = start_server(profile, port)
+        try:
+            url = f"http://127.0.0.1:{port}"
+            wait_for(url + '/')
+            results[profile] = run_load(url, args.concurrency, args.duration, args.sections)
+        finally:
+            stop_server(process)
+    print(f"{args.sections}-section packets, {args.concurrency} concurrent clients, {args.duration:g}s each")
+    print_results(results)
+
+
+if __name__ == '__main__':
+    main()
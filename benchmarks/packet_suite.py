@@ -0,0 +1,202 @@
+"""Benchmark suite for PDFGenerator.generate_pdf.
+
+Usage:
+    python benchmarks/packet_suite.py [--runs 3] [--only PATTERN] [--output results.json]
+    python benchmarks/packet_suite.py --baseline baseline.json [--threshold 10]
+    python benchmarks/packet_suite.py --save-baseline baseline.json
+
+Each fixture runs in a fresh process, so its peak RSS isn't inflated by the
+fixtures before it. Per fixture the suite reports the first (cold cache) and
+best wall time, peak RSS, page count and output bytes. With --baseline the
+results are compared against a saved run; the exit status is 1 if any
+fixture got slower or bigger than --threshold percent.
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pypdf import PdfReader
+from utils.bom_rules import bom_rules
+from utils.pdf_generator import PDFGenerator
+
+# Metrics compared against the baseline, where bigger is worse
+COMPARED_METRICS = ('seconds', 'peak_rss_kb', 'bytes')
+
+
+def board(name, sections, common_amperage='2000', common_depth='30'):
+    """Form data for a board; sections is a list of (section_type, width)."""
+    form_data = {
+        'sales_order': 'BENCH-001',
+        'customer_name': 'Benchmark',
+        'job_address': 'Benchmark Job',
+        'switchboard_name': name,
+        'num_sections': str(len(sections)),
+        'common_depth': common_depth,
+        'common_height': '90',
+        'common_amperage': common_amperage,
+        'common_bus': '4'
+    }
+    for i, (section_type, width) in enumerate(sections, start=1):
+        form_data[f'section_type_{i}'] = section_type
+        form_data[f'width_{i}'] = width
+    return form_data
+
+
+def build_fixtures():
+    """Representative boards, keyed by fixture name."""
+    fixtures = {
+        'mlo_1': board('MLO-1', [('MLO', '36')], common_amperage='4000'),
+        'spectra_10': board('SPECTRA-10', [('Spectra', '44')] * 10),
+        # Mostly Spectra with an MLO every fifth section, across all widths
+        'mixed_40': board('MIXED-40', [('MLO', '36') if i % 5 == 0 else ('Spectra', ('36', '40', '44')[i % 3])
+                                       for i in range(40)], common_amperage='3000', common_depth='36')
+    }
+    fixtures['mixed_40_compact'] = dict(fixtures['mixed_40'], packet_layout='compact')
+    # First, middle and last positions for every amperage and depth
+    domain = bom_rules.current().domain
+    for amperage in domain['amperage']:
+        for depth in domain['depth']:
+            fixtures[f'spectra_3_{amperage}a_{depth}d'] = board(
+                f'{amperage}A-{depth}D', [('Spectra', '44')] * 3, common_amperage=amperage, common_depth=depth)
+    return fixtures
+
+
+def peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def run_fixture(name, runs):
+    """Render one fixture runs times in this process and return its measurements."""
+    form_data = build_fixtures()[name]
+    generator = PDFGenerator()
+    timings = []
+    pdf = b''
+    for _ in range(runs):
+        buffer = io.BytesIO()
+        start = time.perf_counter()
+        generator.generate_pdf(form_data, output=buffer)
+        timings.append(time.perf_counter() - start)
+        pdf = buffer.getvalue()
+
+    return {
+        'cold_seconds': timings[0],
+        'seconds': min(timings),
+        'peak_rss_kb': peak_rss_kb(),
+        'pages': len(PdfReader(io.BytesIO(pdf)).pages),
+        'bytes': len(pdf)
+    }
+
+
+def run_suite(names, runs):
+    results = {}
+    for name in names:
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--fixture', name, '--runs', str(runs)],
+            cwd=ROOT, stdout=subprocess.PIPE, check=True
+        )
+        # generate_pdf may print warnings; the measurements are the last line
+        results[name] = json.loads(completed.stdout.decode('utf-8').strip().splitlines()[-1])
+        print(f"  {name}: {results[name]['seconds']:.3f}s", file=sys.stderr)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True).stdout.decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    header = f"{'fixture':<24} {'cold s':>8} {'best s':>8} {'peak RSS MB':>12} {'pages':>6} {'bytes':>12}"
+    if baseline:
+        header += f" {'time':>8} {'rss':>8} {'bytes':>8}"
+    print(header)
+    for name, r in results.items():
+        line = (f"{name:<24} {r['cold_seconds']:>8.3f} {r['seconds']:>8.3f} {r['peak_rss_kb'] / 1024:>12.1f} "
+                f"{r['pages']:>6} {r['bytes']:>12,}")
+        if baseline and name in baseline:
+            line += ''.join(f" {percent_change(baseline[name][metric], r[metric]):>+7.1f}%"
+                            for metric in COMPARED_METRICS)
+        print(line)
+
+
+def percent_change(before, after):
+    return (after - before) * 100.0 / before if before else 0.0
+
+
+def regressions(results, baseline, threshold):
+    """Return (fixture, metric, change %) for every metric worse than threshold percent."""
+    found = []
+    for name, r in results.items():
+        if name not in baseline:
+            continue
+        for metric in COMPARED_METRICS:
+            change = percent_change(baseline[name][metric], r[metric])
+            if change > threshold:
+                found.append((name, metric, change))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3, help='Renders per fixture (default: 3)')
+    parser.add_argument('--only', help='Only run fixtures whose name matches this regular expression')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against results saved with --output or --save-baseline')
+    parser.add_argument('--save-baseline', help='Write the results to this JSON file as the new baseline')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Regression threshold in percent (default: 10)')
+    parser.add_argument('--fixture', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.fixture:
+        # Child process: measure one fixture and report it on stdout
+        print(json.dumps(run_fixture(args.fixture, args.runs)))
+        return 0
+
+    names = [name for name in build_fixtures() if not args.only or re.search(args.only, name)]
+    results = run_suite(names, args.runs)
+    report = {
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'runs': args.runs,
+        'fixtures': results
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['fixtures']
+    print_results(results, baseline)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    if baseline:
+        found = regressions(results, baseline, args.threshold)
+        for name, metric, change in found:
+            print(f"REGRESSION: {name} {metric} {change:+.1f}%")
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
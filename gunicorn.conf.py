@@ -0,0 +1,24 @@
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+
+# Packet rendering is CPU bound, so default to one worker process per core
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('WEB_THREADS', 2))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+# Build the generator and decode drawings before forking (see wsgi.py)
+preload_app = True
+
+# Packets are streamed from a SpooledTemporaryFile (see generate_pdf_stream).
+# sendfile() needs a file descriptor, and asking the spool for one moves an
+# in-memory packet to disk, so send through the normal write path instead
+sendfile = False
+
+# Large lineups can take a while to render
+timeout = int(os.environ.get('WEB_TIMEOUT', 120))
+graceful_timeout = 30
+
+accesslog = '-'
+errorlog = '-'
@@ -421,6 +421,64 @@ const SectionModule = {
     }
 };
 
+// Preview Module - Shows page count and size from the /preview dry run before rendering
+const PreviewModule = {
+    async show() {
+        if (!FormModule.validate()) {
+            return;
+        }
+
+        const container = document.getElementById('packet-preview');
+        const form = document.getElementById('packetForm');
+        if (!container || !form) return;
+
+        try {
+            const response = await fetch('/preview', {
+                method: 'POST',
+                body: new FormData(form)
+            });
+            const result = await response.json();
+            if (!response.ok) {
+                FormModule.showError(result.error || 'Could not preview this packet');
+                return;
+            }
+            container.innerHTML = this.getTemplate(result);
+            container.style.display = 'block';
+        } catch (error) {
+            FormModule.showError(`Could not preview this packet: ${error.message}`);
+        }
+    },
+
+    formatBytes(bytes) {
+        return bytes >= 1024 * 1024 ? `${(bytes / (1024 * 1024)).toFixed(1)} MB` : `${Math.round(bytes / 1024)} KB`;
+    },
+
+    escape(text) {
+        const div = document.createElement('div');
+        div.textContent = text;
+        return div.innerHTML;
+    },
+
+    getTemplate(result) {
+        const sections = result.sections.map(section => `
+            <li>Section ${section.section} (${this.escape(section.section_type)}): ${section.pages} page${section.pages === 1 ? '' : 's'}, ${section.images.length} drawings</li>
+        `).join('');
+        const missing = result.images.filter(image => image.missing).map(image => this.escape(image.name));
+        const warnings = result.warnings.map(warning => `<li>${this.escape(warning)}</li>`).join('');
+
+        return `
+            <h3 class="text-lg font-medium text-gray-900 mb-2">Packet Preview</h3>
+            <p class="mb-2">${result.total_pages} pages${result.summary_pages ? ` (${result.summary_pages} material summary)` : ''}, about ${this.formatBytes(result.estimated_bytes)} (${this.escape(result.quality)} quality)</p>
+            <ul class="list-disc ml-6 mb-2">${sections}</ul>
+            ${missing.length ? `<p class="text-red-600 mb-2">Missing drawings: ${missing.join(', ')}</p>` : ''}
+            ${warnings ? `<ul class="list-disc ml-6 text-yellow-700">${warnings}</ul>` : ''}
+            <button type="submit" formaction="/material_summary?format=csv" class="mt-2 text-blue-600 hover:underline">
+                Download material list (CSV)
+            </button>
+        `;
+    }
+};
+
 // Event Handlers Module - Centralizes all event handling
 const EventHandlersModule = {
     initialize() {
@@ -434,6 +492,12 @@ const EventHandlersModule = {
             });
         }
 
+        // Packet preview
+        const previewButton = document.getElementById('preview-button');
+        if (previewButton) {
+            previewButton.addEventListener('click', () => PreviewModule.show());
+        }
+
         // Number of sections change
         const numSectionsInput = document.getElementById('num_sections');
         if (numSectionsInput) {
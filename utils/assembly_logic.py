@@ -1,40 +1,9 @@
+from utils.bom_rules import bom_rules
+
+
 def determine_assemblies(data):
     """
     Determine which assemblies and parts are needed based on user input.
-    This is where you'll implement your business logic.
+    The rules live in the "assemblies" list of config/bom_rules.json.
     """
-    assemblies = []
-    
-    # Example logic for a switchboard assembly
-    if 'switchboard_type' in data:
-        if data['switchboard_type'] == 'main':
-            assembly = {
-                'name': 'Main Switchboard',
-                'quantity': data.get('quantity', 1),
-                'parts': [
-                    {
-                        'name': 'Main Cabinet',
-                        'drawing': 'main_cabinet',
-                        'quantity': 1
-                    },
-                    {
-                        'name': 'Main Bus Bar',
-                        'drawing': 'bus_bar',
-                        'quantity': 1
-                    }
-                ]
-            }
-            
-            # Add breakers based on specifications
-            if 'num_breakers' in data:
-                assembly['parts'].append({
-                    'name': 'Circuit Breaker',
-                    'drawing': 'circuit_breaker',
-                    'quantity': int(data['num_breakers'])
-                })
-            
-            assemblies.append(assembly)
-    
-    # Add more assembly types and logic as needed
-    
-    return assemblies 
\ No newline at end of file
+    return bom_rules.current().determine_assemblies(data)
@@ -0,0 +1,150 @@
+"""Batch packet generation for a whole sales order.
+
+Renders several switchboards in parallel on a process pool, kept for the
+life of the process so workers start once and keep their decoded images
+between batches, and returns one merged PDF or a ZIP of per-board packets.
+
+Usage: python -m utils.batch boards.json -o order.pdf [--zip] [--workers N]
+
+boards.json holds a list of switchboard definitions (the same fields the
+packet form posts, or the JSON form described in utils.switchboard) or an
+object with a "boards" list.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from utils.logging_setup import configure_logging
+from utils.pdf_generator import PDFGenerator, packet_filename
+from utils.pdf_merge import merge_pdfs
+from utils.switchboard import Switchboard, parse_switchboard
+
+# Per-process generator used by pool workers
+_worker_generator = None
+
+# Worker pool shared by every batch, started on first use
+_batch_pool = None
+_batch_pool_workers = None
+_batch_pool_lock = threading.Lock()
+
+
+def _render_board(form_data, image_names):
+    global _worker_generator
+    if _worker_generator is None:
+        _worker_generator = PDFGenerator()
+    # Decodes only what earlier batches haven't left in this worker's image cache
+    _worker_generator.preload_images(image_names)
+    
+    # Boards are already spread over the pool, so render each one serially
+    warnings = []
+    pdf = _worker_generator.generate_pdf_stream(form_data, parallel=False, warnings=warnings).read()
+    return pdf, warnings
+
+
+def normalize_board(board):
+    """Parse a board given as form fields or a JSON definition, accepting numbers as well as strings."""
+    if not isinstance(board, (dict, Switchboard)):
+        raise ValueError(f"Switchboard definition must be an object, not {type(board).__name__}")
+    return parse_switchboard(board)
+
+
+def batch_image_names(pdf_generator, boards):
+    """Return every drawing any board in the batch will need."""
+    image_names = set()
+    for form_data in boards:
+        for section_number, section, section_images in pdf_generator.get_section_boms(form_data):
+            image_names.update(item.name for item in section_images)
+    return sorted(image_names)
+
+
+def _get_batch_pool(max_workers):
+    """Return the shared worker pool, replacing it if a different size is asked for."""
+    global _batch_pool, _batch_pool_workers
+    with _batch_pool_lock:
+        if _batch_pool is not None and _batch_pool_workers != max_workers:
+            _batch_pool.shutdown()
+            _batch_pool = None
+        if _batch_pool is None:
+            # Spawned rather than forked from the (threaded) web process, like the section pool
+            _batch_pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+            _batch_pool_workers = max_workers
+        return _batch_pool
+
+
+def generate_batch(boards, max_workers=None, pdf_generator=None, warnings=None):
+    """Render each board and return their PDFs as bytes, in board order.
+    
+    If warnings is a list, every board's packet warnings are appended to it,
+    prefixed with the board's switchboard name.
+    """
+    boards = [normalize_board(board) for board in boards]
+    if not boards:
+        return []
+
+    pdf_generator = pdf_generator or PDFGenerator()
+    image_names = batch_image_names(pdf_generator, boards)
+    max_workers = max_workers or os.cpu_count() or 1
+
+    if max_workers == 1 or len(boards) == 1:
+        pdf_generator.preload_images(image_names)
+        results = []
+        for form_data in boards:
+            board_warnings = []
+            results.append((pdf_generator.generate_pdf_stream(form_data, warnings=board_warnings).read(), board_warnings))
+    else:
+        results = list(_get_batch_pool(max_workers).map(_render_board, boards, [image_names] * len(boards)))
+
+    if warnings is not None:
+        for form_data, (pdf, board_warnings) in zip(boards, results):
+            warnings.extend(f"{form_data.get('switchboard_name', '')}: {warning}" for warning in board_warnings)
+    return [pdf for pdf, board_warnings in results]
+
+
+def zip_packets(boards, pdfs):
+    """Bundle per-board packets into a ZIP named after each board."""
+    output = io.BytesIO()
+    used_names = set()
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for index, (form_data, pdf) in enumerate(zip(boards, pdfs), start=1):
+            name = packet_filename(form_data)
+            if name in used_names:
+                name = f"{name[:-len('.pdf')]} ({index}).pdf"
+            used_names.add(name)
+            archive.writestr(name, pdf)
+    return output.getvalue()
+
+
+def load_boards(path):
+    with open(path) as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get('boards', [])
+    return data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate factory packets for every switchboard in a sales order.')
+    parser.add_argument('boards', help='JSON file with a list of switchboard definitions')
+    parser.add_argument('-o', '--output', required=True, help='Path of the merged PDF (or ZIP with --zip)')
+    parser.add_argument('--zip', action='store_true', help='Write a ZIP of per-board packets instead of one PDF')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: one per CPU)')
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    boards = [normalize_board(board) for board in load_boards(args.boards)]
+    pdfs = generate_batch(boards, max_workers=args.workers)
+    data = zip_packets(boards, pdfs) if args.zip else merge_pdfs(pdfs)
+
+    with open(args.output, 'wb') as f:
+        f.write(data)
+    print(f"Wrote {len(boards)} packets to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,218 @@
+"""BOM rules loaded from a versioned JSON file (config/bom_rules.json).
+
+The rules say which drawings, and how many of each, a section needs for its
+type, width, amperage, depth, bus size and lineup position. At load time they
+are compiled into a decision table holding the BOM of every configuration in
+the file's domain, so resolving a section is a single dict lookup.
+Configurations outside the domain are evaluated against the rules directly.
+
+A section rule matches when every condition it gives holds. A condition is a
+section field (section_type, width, amperage, depth, bus_size, position) with
+one value or a list of values. A matching rule adds its image, in file order,
+with a quantity that is either a number, 'abc' (the amperage quantity times
+abc_multiplier) or 'neutral' (the amperage quantity). A rule with a
+first_match list adds the first of its child rules that matches instead;
+children inherit the parent's quantity.
+
+The file is re-read when it changes on disk, at most once every
+BOM_RULES_RELOAD_SECONDS, so rule edits apply without restarting workers. A
+file that fails to load is logged and the previous rules stay in effect.
+
+Environment:
+    BOM_RULES_PATH             rules file (default: config/bom_rules.json)
+    BOM_RULES_RELOAD_SECONDS   how often to check it for changes (default: 2)
+"""
+import hashlib
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+BOMItem = namedtuple('BOMItem', ['name', 'quantity'])
+
+# Rules file format understood by this module
+BOM_RULES_SCHEMA_VERSION = 1
+
+# Section fields a rule can test, in decision table key order
+RULE_FIELDS = ('section_type', 'width', 'amperage', 'depth', 'bus_size', 'position')
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                  'config', 'bom_rules.json')
+
+CompiledRule = namedtuple('CompiledRule', ['conditions', 'image', 'quantity', 'first_match'])
+
+
+def compile_rule(rule, inherited_quantity=None):
+    """Turn a rule from the file into a CompiledRule with frozenset conditions."""
+    unknown = set(rule) - set(RULE_FIELDS) - {'image', 'quantity', 'first_match'}
+    if unknown:
+        raise ValueError(f"Unknown keys in BOM rule {rule}: {', '.join(sorted(unknown))}")
+
+    conditions = []
+    for field in RULE_FIELDS:
+        if field in rule:
+            values = rule[field] if isinstance(rule[field], list) else [rule[field]]
+            conditions.append((RULE_FIELDS.index(field), frozenset(str(value) for value in values)))
+
+    quantity = rule.get('quantity', inherited_quantity)
+    first_match = tuple(compile_rule(child, quantity) for child in rule.get('first_match', ()))
+    if not first_match:
+        if 'image' not in rule:
+            raise ValueError(f"BOM rule needs an image or a first_match list: {rule}")
+        if not isinstance(quantity, int) and quantity not in ('abc', 'neutral'):
+            raise ValueError(f"BOM rule quantity must be a number, 'abc' or 'neutral': {rule}")
+    return CompiledRule(tuple(conditions), rule.get('image'), quantity, first_match)
+
+
+def rule_matches(rule, key):
+    return all(key[index] in values for index, values in rule.conditions)
+
+
+class BOMRules:
+    """One compiled version of the rules file."""
+
+    def __init__(self, data, fingerprint=''):
+        if data.get('schema_version') != BOM_RULES_SCHEMA_VERSION:
+            raise ValueError(f"Unsupported BOM rules schema version: {data.get('schema_version')!r}")
+
+        self.version = str(data.get('version', ''))
+        self.fingerprint = fingerprint
+        self.domain = {field: tuple(str(value) for value in data['domain'].get(field, ())) for field in RULE_FIELDS}
+        self.amperage_quantities = {str(amperage): quantity for amperage, quantity in data['amperage_quantities'].items()}
+        self.default_amperage_quantity = data.get('default_amperage_quantity', 1)
+        self.abc_multiplier = data.get('abc_multiplier', 1)
+        self.labels = dict(data.get('labels', {}))
+        self.rules = tuple(compile_rule(rule) for rule in data.get('sections', ()))
+
+        # switchboard_type -> assembly templates
+        self.assemblies = {}
+        for assembly in data.get('assemblies', ()):
+            self.assemblies.setdefault(assembly['switchboard_type'], []).append(assembly)
+
+        self.table = self.compile_table()
+
+    def compile_table(self):
+        """Resolve the BOM for every configuration in the domain.
+
+        Configurations with the same BOM share one tuple.
+        """
+        table = {}
+        shared = {}
+        for key in itertools.product(*(self.domain[field] for field in RULE_FIELDS)):
+            bom = self.evaluate(key)
+            table[key] = shared.setdefault(bom, bom)
+        return table
+
+    def quantity(self, quantity, amperage):
+        if quantity in ('abc', 'neutral'):
+            base_quantity = self.amperage_quantities.get(amperage, self.default_amperage_quantity)
+            return base_quantity * self.abc_multiplier if quantity == 'abc' else base_quantity
+        return quantity
+
+    def evaluate(self, key):
+        """Apply the rules to a configuration key; the slow path behind lookup()."""
+        amperage = key[RULE_FIELDS.index('amperage')]
+        items = []
+        for rule in self.rules:
+            if not rule_matches(rule, key):
+                continue
+            if rule.first_match:
+                rule = next((child for child in rule.first_match if rule_matches(child, key)), None)
+                if rule is None:
+                    continue
+            items.append(BOMItem(rule.image, self.quantity(rule.quantity, amperage)))
+        return tuple(items)
+
+    def lookup(self, key):
+        """Return the BOM for (section_type, width, amperage, depth, bus_size, position)."""
+        bom = self.table.get(key)
+        if bom is None:
+            # Configuration outside the domain, not worth keeping
+            bom = self.evaluate(key)
+        return bom
+
+    def image_names(self):
+        """Every image any rule can add."""
+        image_names = set()
+        pending = list(self.rules)
+        while pending:
+            rule = pending.pop()
+            if rule.image:
+                image_names.add(rule.image)
+            pending.extend(rule.first_match)
+        return sorted(image_names)
+
+    def determine_assemblies(self, data):
+        """Return the assemblies and parts a switchboard needs (see utils.assembly_logic)."""
+        assemblies = []
+        for template in self.assemblies.get(data.get('switchboard_type'), ()):
+            parts = []
+            for part in template['parts']:
+                if 'quantity_field' in part:
+                    # Parts counted by a form field are only included when it is given
+                    if part['quantity_field'] not in data:
+                        continue
+                    quantity = int(data[part['quantity_field']])
+                else:
+                    quantity = part.get('quantity', 1)
+                parts.append({'name': part['name'], 'drawing': part['drawing'], 'quantity': quantity})
+            assemblies.append({
+                'name': template['name'],
+                'quantity': data.get(template.get('quantity_field', 'quantity'), template.get('quantity', 1)),
+                'parts': parts
+            })
+        return assemblies
+
+
+def load_rules(path):
+    with open(path, 'rb') as f:
+        content = f.read()
+    return BOMRules(json.loads(content.decode('utf-8')), hashlib.sha256(content).hexdigest())
+
+
+class RulesFile:
+    """The current BOMRules for a rules file, reloaded when the file changes."""
+
+    def __init__(self, path, check_interval=2.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._rules = None
+        self._stat = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def current(self):
+        """Return the compiled rules, reloading them first if the file changed."""
+        rules = self._rules
+        if rules is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return rules
+
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                stat = os.stat(self.path)
+                signature = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                signature = None
+            if self._rules is not None and signature == self._stat:
+                return self._rules
+
+            try:
+                self._rules = load_rules(self.path)
+                logger.info("Loaded BOM rules version %s from %s", self._rules.version, self.path)
+            except Exception:
+                if self._rules is None:
+                    raise
+                logger.exception("Could not reload BOM rules from %s; keeping version %s",
+                                 self.path, self._rules.version)
+            self._stat = signature
+            return self._rules
+
+
+bom_rules = RulesFile(os.environ.get('BOM_RULES_PATH', DEFAULT_RULES_PATH),
+                      float(os.environ.get('BOM_RULES_RELOAD_SECONDS', 2)))
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import threading
+
+# Bump when the entry format or what a drawing's description records changes
+DRAWING_INDEX_VERSION = 1
+
+# File extension of the drawings parts refer to
+DRAWING_SUFFIX = '.dwg'
+
+
+class DrawingIndex:
+    """Persistent manifest of the drawings directory.
+
+    Each drawing is recorded by name (file name without .dwg) with its path,
+    mtime, size, sha256, entity counts and bounding box, so drawings can be
+    looked up and validated without touching or parsing the files. refresh()
+    only re-hashes files whose mtime or size changed and never parses them:
+    a drawing with new content has entity_counts None until whoever next
+    parses it passes its description to record_descriptions(). This keeps the
+    index independent of the DXF reader, and lets the parse happen in a
+    worker that can be timed out.
+    """
+
+    def __init__(self, drawings_dir, manifest_path):
+        self.drawings_dir = drawings_dir
+        self.manifest_path = manifest_path
+        self._entries = None
+        self._lock = threading.RLock()
+
+    def _load(self):
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get('version') != DRAWING_INDEX_VERSION:
+            return {}
+        return manifest.get('drawings', {})
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.manifest_path) or '.', exist_ok=True)
+        # Write under a temporary name so readers never see a partial manifest
+        partial_path = f"{self.manifest_path}.{os.getpid()}.part"
+        with open(partial_path, 'w') as f:
+            json.dump({'version': DRAWING_INDEX_VERSION, 'drawings': self._entries}, f, indent=1, sort_keys=True)
+        os.replace(partial_path, self.manifest_path)
+
+    @property
+    def entries(self):
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            return self._entries
+
+    def refresh(self):
+        """Bring the index up to date with the drawings directory.
+
+        Returns the names of drawings that were added, changed or removed.
+        """
+        with self._lock:
+            entries = self.entries
+            changed = []
+            seen = set()
+
+            if os.path.isdir(self.drawings_dir):
+                with os.scandir(self.drawings_dir) as scan:
+                    for entry in scan:
+                        if not entry.is_file() or not entry.name.endswith(DRAWING_SUFFIX):
+                            continue
+                        name = entry.name[:-len(DRAWING_SUFFIX)]
+                        seen.add(name)
+                        stat = entry.stat()
+                        current = entries.get(name)
+                        if current and current['mtime_ns'] == stat.st_mtime_ns and current['size'] == stat.st_size:
+                            continue
+                        entries[name] = self._index_file(entry.path, stat, current)
+                        changed.append(name)
+
+            for name in list(entries):
+                if name not in seen:
+                    del entries[name]
+                    changed.append(name)
+
+            if changed:
+                self._save()
+            return changed
+
+    def _index_file(self, path, stat, current=None):
+        sha256 = file_sha256(path)
+        if current and current['sha256'] == sha256:
+            # Touched but unchanged: keep what was parsed before
+            return dict(current, path=path, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+
+        entry = {
+            'path': path,
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha256': sha256,
+            'entity_counts': None,
+            'bounds': None,
+            'error': None
+        }
+        return entry
+
+    def record_descriptions(self, descriptions):
+        """Store what parsing drawings found out about them.
+
+        descriptions maps a file path to (sha256, description, error), where
+        description is (entity_counts, bounds), or None with error set if the
+        file couldn't be parsed. Results for content the index no longer has
+        are dropped.
+        """
+        with self._lock:
+            recorded = False
+            for path, (sha256, description, error) in descriptions.items():
+                entry = self.entry_for_path(path)
+                if entry is None or entry['sha256'] != sha256:
+                    continue
+                if description is None:
+                    entry.update(entity_counts={}, bounds=None, error=error)
+                else:
+                    entity_counts, bounds = description
+                    entry.update(entity_counts=entity_counts, bounds=list(bounds) if bounds else None, error=None)
+                recorded = True
+            if recorded:
+                self._save()
+
+    def get(self, name):
+        """Return the entry for a drawing name, or None if there is no such drawing."""
+        return self.entries.get(name)
+
+    def entry_for_path(self, path):
+        """Return the entry for a file path if the index is current for it, otherwise None."""
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.drawings_dir):
+            return None
+        name = os.path.basename(path)
+        if not name.endswith(DRAWING_SUFFIX):
+            return None
+        entry = self.get(name[:-len(DRAWING_SUFFIX)])
+        if entry is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if entry['mtime_ns'] != stat.st_mtime_ns or entry['size'] != stat.st_size:
+            return None
+        return entry
+
+    def validate(self, names, drawable_types):
+        """Check drawing names against the index.
+
+        Returns a dict of name -> problem for drawings that are missing,
+        unreadable, or have none of drawable_types. Drawings not described
+        yet pass; loading them reports any problem.
+        """
+        problems = {}
+        for name in names:
+            entry = self.get(name)
+            if entry is None:
+                problems[name] = 'drawing not found'
+            elif entry['error']:
+                problems[name] = entry['error']
+            elif entry['entity_counts'] is None:
+                continue
+            elif not any(entry['entity_counts'].get(kind) for kind in drawable_types):
+                problems[name] = 'no drawable entities'
+        return problems
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -1,74 +1,514 @@
+import logging
+import math
+import multiprocessing
 import os
+import time
+from collections import namedtuple
+from multiprocessing.connection import wait
 import ezdxf
-from PIL import Image, ImageDraw
+import numpy as np
+from ezdxf import path as dxf_path
+from PIL import Image
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
-import tempfile
+from reportlab.lib.utils import ImageReader
+from collections import Counter
 from datetime import datetime
+from utils.cache import LRUCache
+from utils.drawing_index import DrawingIndex
 
-def convert_dwg_to_image(dwg_path, output_size=(800, 600)):
-    """Convert a DWG file to a PIL Image."""
-    try:
-        # Read the DWG file
-        doc = ezdxf.readfile(dwg_path)
-        msp = doc.modelspace()
-        
-        # Create a new image with white background
-        image = Image.new('RGB', output_size, 'white')
-        draw = ImageDraw.Draw(image)
-        
-        # Get the drawing bounds
-        bounds = None
-        for entity in msp:
-            if hasattr(entity, 'get_bbox'):
-                entity_bounds = entity.get_bbox()
-                if entity_bounds:
-                    if bounds is None:
-                        bounds = entity_bounds
-                    else:
-                        bounds = (
-                            min(bounds[0], entity_bounds[0]),
-                            min(bounds[1], entity_bounds[1]),
-                            max(bounds[2], entity_bounds[2]),
-                            max(bounds[3], entity_bounds[3])
-                        )
-        
-        if bounds is None:
-            raise ValueError("No drawable entities found in the DWG file")
-        
-        # Calculate scale factor
-        width = bounds[2] - bounds[0]
-        height = bounds[3] - bounds[1]
-        scale_x = (output_size[0] - 40) / width
-        scale_y = (output_size[1] - 40) / height
-        scale = min(scale_x, scale_y)
+logger = logging.getLogger(__name__)
+
+# Directory parts' drawings are read from, and the manifest indexing it
+DRAWINGS_DIR = 'drawings'
+DRAWING_INDEX_PATH = os.path.join('output', 'drawing_index.json')
+
+# Rasterized drawings keyed by (drawing key, output size); shared by every packet
+raster_cache = LRUCache(max_entries=int(os.environ.get('DRAWING_RASTER_CACHE_SIZE', 32)))
+
+# Parsed vector drawings keyed by drawing key
+vector_cache = LRUCache(max_entries=int(os.environ.get('DRAWING_VECTOR_CACHE_SIZE', 32)))
+
+# Entities the vector path draws; anything else in the modelspace is skipped
+VECTOR_ENTITY_TYPES = 'LINE ARC CIRCLE LWPOLYLINE TEXT'
+
+# Stroke width as a fraction of the drawing's larger extent, so lines keep
+# the same weight on the page however large the drawing units are
+LINE_WIDTH_RATIO = 0.001
+
+# DXF TEXT height is the cap height; Helvetica's cap height is 0.718 em
+CAP_HEIGHT_RATIO = 0.718
+
+# Rough Helvetica advance per character as a fraction of the font size, for bounds
+TEXT_WIDTH_RATIO = 0.6
+
+# Parsed drawing: primitives in drawing units and their (min_x, min_y, max_x, max_y)
+VectorDrawing = namedtuple('VectorDrawing', ['primitives', 'bounds'])
+
+# Drawings loaded at once ahead of layout (0 loads them inline as parts are drawn)
+PREFETCH_WORKERS = int(os.environ.get('DRAWING_PREFETCH_WORKERS', os.cpu_count() or 1))
+
+# Size drawings are rasterized at for raster packets
+DRAWING_RASTER_SIZE = (800, 600)
+
+# Prefetch workers are spawned, not forked: the web process has threads (job
+# queue, log listener, gthread workers) whose locks a forked child could inherit held
+WORKER_CONTEXT = multiprocessing.get_context('spawn')
+
+# Seconds one drawing may take to load before its worker is killed
+DRAWING_TIMEOUT = float(os.environ.get('DRAWING_TIMEOUT', 60))
+
+# Pixel samples rasterized per NumPy batch, bounds the size of the temporary arrays
+SAMPLE_BATCH_SIZE = 1 << 20
+
+# Blank border around the drawing, in pixels
+MARGIN = 20
+
+
+def drawing_cache_key(dwg_path):
+    """Content hash of an indexed drawing, else (path, mtime) for files the index doesn't cover."""
+    entry = drawing_index.entry_for_path(dwg_path)
+    if entry is not None:
+        return entry['sha256']
+    return (os.path.abspath(dwg_path), os.stat(dwg_path).st_mtime_ns)
+
+
+def read_line_segments(dwg_path):
+    """Return every LINE in the modelspace as an (n, 4) array of x1, y1, x2, y2."""
+    return line_segments(ezdxf.readfile(dwg_path).modelspace().query('LINE'))
+
+
+def line_segments(lines):
+    """Return LINE entities as an (n, 4) array of x1, y1, x2, y2."""
+    coordinates = []
+    for entity in lines:
+        start = entity.dxf.start
+        end = entity.dxf.end
+        coordinates.append((start[0], start[1], end[0], end[1]))
+    return np.array(coordinates, dtype=np.float64).reshape(-1, 4)
+
+
+def fit_segments(segments, output_size, bounds=None):
+    """Transform drawing coordinates to pixel coordinates fitted inside output_size.
+    
+    bounds (min_x, min_y, max_x, max_y) defaults to the extents of the segments.
+    """
+    if bounds is None:
+        xs = segments[:, [0, 2]]
+        ys = segments[:, [1, 3]]
+        bounds = (xs.min(), ys.min(), xs.max(), ys.max())
+    
+    # Calculate scale factor
+    width = bounds[2] - bounds[0]
+    height = bounds[3] - bounds[1]
+    scales = []
+    if width > 0:
+        scales.append((output_size[0] - 2 * MARGIN) / width)
+    if height > 0:
+        scales.append((output_size[1] - 2 * MARGIN) / height)
+    scale = min(scales) if scales else 1.0
+    
+    # Transform coordinates, flipping y since image rows grow downwards
+    pixels = np.empty_like(segments)
+    pixels[:, [0, 2]] = (segments[:, [0, 2]] - bounds[0]) * scale + MARGIN
+    pixels[:, [1, 3]] = output_size[1] - ((segments[:, [1, 3]] - bounds[1]) * scale + MARGIN)
+    return pixels
+
+
+def rasterize_segments(pixels, output_size):
+    """Draw 1px black line segments onto a white grayscale array, a batch at a time.
+    
+    Batches are cut by pixel samples rather than segments, since a few long
+    segments can need as many samples as thousands of short ones.
+    """
+    width, height = output_size
+    raster = np.full((height, width), 255, dtype=np.uint8)
+    
+    # Sample every segment once per pixel along its longer axis
+    x1, y1, x2, y2 = pixels.T
+    all_steps = np.maximum(np.abs(x2 - x1), np.abs(y2 - y1)).astype(np.int64) + 1
+    
+    # Start a batch wherever the running sample count passes a multiple of SAMPLE_BATCH_SIZE
+    batch_numbers = (np.cumsum(all_steps) - 1) // SAMPLE_BATCH_SIZE
+    batch_starts = np.flatnonzero(np.diff(batch_numbers, prepend=-1))
+    batch_ends = np.append(batch_starts[1:], len(all_steps))
+    
+    for batch_start, batch_end in zip(batch_starts, batch_ends):
+        x1, y1, x2, y2 = pixels[batch_start:batch_end].T
+        steps = all_steps[batch_start:batch_end]
+        segment_index = np.repeat(np.arange(len(steps)), steps)
+        offsets = np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)
+        t = offsets / np.maximum(steps[segment_index] - 1, 1)
         
-        # Draw entities
-        for entity in msp:
-            if entity.dxftype() == 'LINE':
-                start = entity.dxf.start
-                end = entity.dxf.end
-                
-                # Transform coordinates
-                x1 = (start[0] - bounds[0]) * scale + 20
-                y1 = output_size[1] - ((start[1] - bounds[1]) * scale + 20)
-                x2 = (end[0] - bounds[0]) * scale + 20
-                y2 = output_size[1] - ((end[1] - bounds[1]) * scale + 20)
-                
-                draw.line([(x1, y1), (x2, y2)], fill='black', width=1)
-            
-            # Add support for other entity types as needed
+        xs = np.rint(x1[segment_index] + (x2 - x1)[segment_index] * t).astype(np.int64)
+        ys = np.rint(y1[segment_index] + (y2 - y1)[segment_index] * t).astype(np.int64)
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        raster[ys[inside], xs[inside]] = 0
+    
+    return raster
+
+
+def convert_dwg_to_image(dwg_path, output_size=DRAWING_RASTER_SIZE):
+    """Convert a DWG file to a PIL Image.
+    
+    Results are cached by drawing content and output size; treat the
+    returned image as read-only.
+    """
+    try:
+        key = (drawing_cache_key(dwg_path), tuple(output_size))
+        image = raster_cache.get(key)
+        if image is not None:
+            return image
         
+        image = rasterize_drawing(read_line_segments(dwg_path), output_size)
+        raster_cache.put(key, image)
         return image
     except Exception as e:
         raise Exception(f"Error converting DWG to image: {str(e)}")
 
-def process_drawings(assemblies):
-    """Generate a PDF packet from the assembly list."""
+
+def rasterize_drawing(segments, output_size):
+    """Render line segments in drawing units to an RGB image fitted inside output_size."""
+    if len(segments) == 0:
+        raise ValueError("No drawable entities found in the DWG file")
+    pixels = fit_segments(segments, output_size)
+    return Image.fromarray(rasterize_segments(pixels, output_size), 'L').convert('RGB')
+
+
+def read_vector_drawing(dwg_path):
+    """Parse a DXF into a VectorDrawing, cached by drawing content."""
+    key = drawing_cache_key(dwg_path)
+    drawing = vector_cache.get(key)
+    if drawing is not None:
+        return drawing
+    
+    doc = ezdxf.readfile(dwg_path)
+    primitives = vector_primitives(doc.modelspace().query(VECTOR_ENTITY_TYPES))
+    if not primitives:
+        raise ValueError("No drawable entities found in the DWG file")
+    
+    drawing = VectorDrawing(primitives, primitive_bounds(primitives))
+    vector_cache.put(key, drawing)
+    return drawing
+
+
+def vector_primitives(entities):
+    """Convert DXF entities to drawing primitives, skipping unsupported types.
+    
+    Primitives are tuples:
+        ('line', x1, y1, x2, y2)
+        ('arc', cx, cy, radius, start_angle, end_angle)
+        ('circle', cx, cy, radius)
+        ('polyline', ((x, y), ...), closed)
+        ('text', x, y, height, rotation, text)
+    """
+    primitives = []
+    for entity in entities:
+        kind = entity.dxftype()
+        if kind == 'LINE':
+            start, end = entity.dxf.start, entity.dxf.end
+            primitives.append(('line', start[0], start[1], end[0], end[1]))
+        elif kind == 'ARC':
+            center = entity.dxf.center
+            primitives.append(('arc', center[0], center[1], entity.dxf.radius,
+                               entity.dxf.start_angle, entity.dxf.end_angle))
+        elif kind == 'CIRCLE':
+            center = entity.dxf.center
+            primitives.append(('circle', center[0], center[1], entity.dxf.radius))
+        elif kind == 'LWPOLYLINE':
+            # Flatten bulges (arc segments) to short straight runs
+            points = tuple((v[0], v[1]) for v in dxf_path.make_path(entity).flattening(0.01))
+            if len(points) > 1:
+                primitives.append(('polyline', points, entity.closed))
+        elif kind == 'TEXT':
+            insert = entity.dxf.insert
+            primitives.append(('text', insert[0], insert[1], entity.dxf.height,
+                               entity.dxf.rotation, entity.plain_text()))
+    return primitives
+
+
+def read_drawing(dwg_path, mode):
+    """Parse a drawing once, for the packet and for the drawing index.
+    
+    Returns (drawing, description, error): what load_drawing returns for
+    mode, the (entity_counts, bounds) the index records (None if the file
+    couldn't be parsed), and the error message if there is no drawing.
+    """
+    description = None
+    try:
+        entities = list(ezdxf.readfile(dwg_path).modelspace())
+        drawable = VECTOR_ENTITY_TYPES.split()
+        primitives = vector_primitives(entity for entity in entities if entity.dxftype() in drawable)
+        bounds = primitive_bounds(primitives) if primitives else None
+        description = (dict(Counter(entity.dxftype() for entity in entities)), bounds)
+        
+        if mode == 'vector':
+            if not primitives:
+                raise ValueError("No drawable entities found in the DWG file")
+            return VectorDrawing(primitives, bounds), description, None
+        lines = (entity for entity in entities if entity.dxftype() == 'LINE')
+        return rasterize_drawing(line_segments(lines), DRAWING_RASTER_SIZE), description, None
+    except Exception as e:
+        # Same messages as read_vector_drawing and convert_dwg_to_image
+        return None, description, str(e) if mode == 'vector' else f"Error converting DWG to image: {str(e)}"
+
+
+def primitive_points(primitive):
+    """Yield points whose bounding box contains the primitive."""
+    kind = primitive[0]
+    if kind == 'line':
+        yield primitive[1], primitive[2]
+        yield primitive[3], primitive[4]
+    elif kind == 'arc':
+        cx, cy, r, start_angle, end_angle = primitive[1:]
+        sweep = (end_angle - start_angle) % 360 or 360
+        # The end points plus every quadrant point the arc passes through
+        for angle in (start_angle, end_angle, 0, 90, 180, 270):
+            if (angle - start_angle) % 360 <= sweep:
+                yield cx + r * math.cos(math.radians(angle)), cy + r * math.sin(math.radians(angle))
+    elif kind == 'circle':
+        cx, cy, r = primitive[1:]
+        yield cx - r, cy - r
+        yield cx + r, cy + r
+    elif kind == 'polyline':
+        yield from primitive[1]
+    elif kind == 'text':
+        x, y, height, rotation, text = primitive[1:]
+        width = len(text) * height / CAP_HEIGHT_RATIO * TEXT_WIDTH_RATIO
+        cos_r, sin_r = math.cos(math.radians(rotation)), math.sin(math.radians(rotation))
+        for dx, dy in ((0, 0), (width, 0), (0, height), (width, height)):
+            yield x + dx * cos_r - dy * sin_r, y + dx * sin_r + dy * cos_r
+
+
+def primitive_bounds(primitives):
+    xs = []
+    ys = []
+    for primitive in primitives:
+        for x, y in primitive_points(primitive):
+            xs.append(x)
+            ys.append(y)
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+# Index of DRAWINGS_DIR, refreshed by process_drawings; prefetch_drawings records descriptions
+drawing_index = DrawingIndex(DRAWINGS_DIR, DRAWING_INDEX_PATH)
+
+
+def draw_vector_primitives(c, drawing):
+    """Stroke a VectorDrawing onto the canvas in drawing units."""
+    min_x, min_y, max_x, max_y = drawing.bounds
+    c.setLineWidth(max(max_x - min_x, max_y - min_y) * LINE_WIDTH_RATIO)
+    
+    path = c.beginPath()
+    texts = []
+    for primitive in drawing.primitives:
+        kind = primitive[0]
+        if kind == 'line':
+            path.moveTo(primitive[1], primitive[2])
+            path.lineTo(primitive[3], primitive[4])
+        elif kind == 'arc':
+            cx, cy, r, start_angle, end_angle = primitive[1:]
+            extent = (end_angle - start_angle) % 360 or 360
+            # PDFPathObject.arc moves to the arc start itself
+            path.arc(cx - r, cy - r, cx + r, cy + r, startAng=start_angle, extent=extent)
+        elif kind == 'circle':
+            path.circle(primitive[1], primitive[2], primitive[3])
+        elif kind == 'polyline':
+            points, closed = primitive[1], primitive[2]
+            path.moveTo(*points[0])
+            for point in points[1:]:
+                path.lineTo(*point)
+            if closed:
+                path.close()
+        elif kind == 'text':
+            texts.append(primitive)
+    c.drawPath(path, stroke=1, fill=0)
+    
+    for _, x, y, height, rotation, text in texts:
+        c.saveState()
+        c.translate(x, y)
+        c.rotate(rotation)
+        c.setFont("Helvetica", height / CAP_HEIGHT_RATIO)
+        c.drawString(0, 0, text)
+        c.restoreState()
+
+
+def draw_dwg_vector(c, dwg_path, x, y, width, height, drawing_forms, drawing=None):
+    """Draw a DXF as vector paths fitted inside the box, keeping its aspect ratio.
+    
+    Each drawing becomes one form XObject per document; drawing_forms maps
+    paths to the form names already defined on this canvas. drawing is the
+    parsed VectorDrawing if the caller already has it.
+    """
+    if drawing is None:
+        drawing = read_vector_drawing(dwg_path)
+    min_x, min_y, max_x, max_y = drawing.bounds
+    
+    form_name = drawing_forms.get(dwg_path)
+    if form_name is None:
+        form_name = f"dxf_{len(drawing_forms)}"
+        c.beginForm(form_name, min_x, min_y, max_x, max_y)
+        draw_vector_primitives(c, drawing)
+        c.endForm()
+        drawing_forms[dwg_path] = form_name
+    
+    # Fit and center the drawing in the box
+    drawing_width = max(max_x - min_x, 1e-9)
+    drawing_height = max(max_y - min_y, 1e-9)
+    scale = min(width / drawing_width, height / drawing_height)
+    
+    c.saveState()
+    c.translate(x + (width - drawing_width * scale) / 2, y + (height - drawing_height * scale) / 2)
+    c.scale(scale, scale)
+    c.translate(-min_x, -min_y)
+    c.doForm(form_name)
+    c.restoreState()
+
+
+def load_drawing(dwg_path, mode):
+    """Parse (vector) or rasterize (raster) a drawing for process_drawings."""
+    if mode == 'vector':
+        return read_vector_drawing(dwg_path)
+    return convert_dwg_to_image(dwg_path)
+
+
+def loaded_drawing_cache(dwg_path, mode):
+    """Return the (cache, key) load_drawing keeps a drawing under for this mode."""
+    if mode == 'vector':
+        return vector_cache, drawing_cache_key(dwg_path)
+    return raster_cache, (drawing_cache_key(dwg_path), DRAWING_RASTER_SIZE)
+
+
+def _load_drawing_worker(dwg_path, mode, conn):
+    try:
+        conn.send(read_drawing(dwg_path, mode))
+    finally:
+        conn.close()
+
+
+def drawing_names(assemblies):
+    """Return the unique drawing names the assemblies refer to, in first-use order."""
+    names = []
+    for assembly in assemblies:
+        for part in assembly['parts']:
+            if part['drawing'] not in names:
+                names.append(part['drawing'])
+    return names
+
+
+def validate_assemblies(assemblies, mode='vector'):
+    """Check every drawing the assemblies need against the drawing index.
+    
+    Returns a dict of drawing name -> problem, empty if none is known to be
+    unusable. Refreshing the index only stats and hashes files; drawings
+    with new content are checked when prefetch_drawings parses them.
+    """
+    drawing_index.refresh()
+    drawable_types = VECTOR_ENTITY_TYPES.split() if mode == 'vector' else ['LINE']
+    return drawing_index.validate(drawing_names(assemblies), drawable_types)
+
+
+def prefetch_drawings(dwg_paths, mode, max_workers=None, timeout=None):
+    """Load drawings in worker processes, at most max_workers at a time.
+    
+    Drawings already in the raster or vector cache are taken from it; only
+    misses start a worker, and what the workers load is added to the cache.
+    Each drawing gets its own process so one that hangs or exceeds timeout
+    seconds can be killed without affecting the rest. The same parse
+    describes the drawing for the drawing index. Returns (drawings, errors):
+    loaded drawings and exceptions, both keyed by path.
+    """
+    max_workers = PREFETCH_WORKERS if max_workers is None else max_workers
+    timeout = DRAWING_TIMEOUT if timeout is None else timeout
+    
+    drawings = {}
+    errors = {}
+    descriptions = {}
+    pending = []
+    running = {}
+    
+    for dwg_path in dwg_paths:
+        entry = drawing_index.entry_for_path(dwg_path)
+        try:
+            cache, key = loaded_drawing_cache(dwg_path, mode)
+        except OSError:
+            # Gone since it was indexed; the worker reports the error
+            cache, key = None, None
+        drawing = cache.get(key) if cache is not None else None
+        # A drawing the index hasn't described yet is parsed again to describe it
+        if drawing is not None and (entry is None or entry['entity_counts'] is not None):
+            drawings[dwg_path] = drawing
+        else:
+            pending.append((dwg_path, entry, cache, key))
+    
+    while pending or running:
+        # Start workers up to the concurrency limit
+        while pending and len(running) < max_workers:
+            dwg_path, entry, cache, key = pending.pop(0)
+            parent_conn, child_conn = WORKER_CONTEXT.Pipe(duplex=False)
+            process = WORKER_CONTEXT.Process(target=_load_drawing_worker, args=(dwg_path, mode, child_conn), daemon=True)
+            process.start()
+            child_conn.close()
+            running[parent_conn] = (dwg_path, entry, cache, key, process, time.monotonic() + timeout)
+        
+        next_deadline = min(deadline for *_, deadline in running.values())
+        for conn in wait(list(running), timeout=max(0, next_deadline - time.monotonic())):
+            dwg_path, entry, cache, key, process, _ = running.pop(conn)
+            try:
+                drawing, description, error = conn.recv()
+                if entry is not None:
+                    descriptions[dwg_path] = (entry['sha256'], description, error)
+            except EOFError:
+                drawing, error = None, f"worker exited with code {process.exitcode}"
+            conn.close()
+            process.join()
+            if drawing is not None:
+                drawings[dwg_path] = drawing
+                # The worker's own cache dies with it
+                if cache is not None:
+                    cache.put(key, drawing)
+            else:
+                errors[dwg_path] = Exception(error)
+        
+        # Kill workers that ran out of time
+        now = time.monotonic()
+        for conn, (dwg_path, _, _, _, process, deadline) in list(running.items()):
+            if now >= deadline:
+                process.terminate()
+                process.join()
+                conn.close()
+                del running[conn]
+                errors[dwg_path] = TimeoutError(f"Loading {dwg_path} took longer than {timeout:g}s")
+    
+    drawing_index.record_descriptions(descriptions)
+    return drawings, errors
+
+
+def process_drawings(assemblies, mode='vector', max_workers=None, timeout=None):
+    """Generate a PDF packet from the assembly list.
+    
+    mode 'vector' draws each DXF as paths (one reusable form per drawing);
+    'raster' embeds the 800x600 rasterized image. Drawings are looked up
+    and validated in the drawing index, then, unless max_workers is 0,
+    loaded up front by prefetch_drawings.
+    """
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     output_file = os.path.join('output', f'packet_{timestamp}.pdf')
     
     c = canvas.Canvas(output_file, pagesize=letter)
+    drawing_forms = {}
+    image_readers = {}
+    
+    # Rule out missing and unusable drawings without opening them
+    problems = validate_assemblies(assemblies, mode)
+    dwg_paths = [drawing_index.get(name)['path'] for name in drawing_names(assemblies) if name not in problems]
+    
+    # Load all drawings in parallel before laying out any pages
+    max_workers = PREFETCH_WORKERS if max_workers is None else max_workers
+    if max_workers > 0:
+        drawings, errors = prefetch_drawings(dwg_paths, mode, max_workers, timeout)
+    else:
+        drawings, errors = {}, {}
     
     for assembly in assemblies:
         # Add assembly information
@@ -81,26 +521,36 @@ def process_drawings(assemblies):
         y_position = 700
         for part in assembly['parts']:
             try:
-                dwg_path = os.path.join('drawings', f"{part['drawing']}.dwg")
-                if not os.path.exists(dwg_path):
-                    raise FileNotFoundError(f"Drawing file not found: {dwg_path}")
+                entry = drawing_index.get(part['drawing'])
+                if entry is None:
+                    raise FileNotFoundError(f"Drawing file not found: {os.path.join(DRAWINGS_DIR, part['drawing'])}.dwg")
+                if part['drawing'] in problems:
+                    raise ValueError(problems[part['drawing']])
+                dwg_path = entry['path']
+                if dwg_path in errors:
+                    raise errors[dwg_path]
                 
-                # Convert DWG to image
-                image = convert_dwg_to_image(dwg_path)
+                # Load first so a bad drawing leaves only the error line on the page
+                drawing = drawings.get(dwg_path)
+                if drawing is None:
+                    drawing = load_drawing(dwg_path, mode)
                 
-                # Save image to temporary file
-                with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
-                    image.save(tmp.name)
-                    
-                    # Add part information
-                    c.drawString(50, y_position, f"Part: {part['name']}")
-                    c.drawString(50, y_position - 20, f"Quantity: {part['quantity']}")
-                    
-                    # Add image to PDF
-                    c.drawImage(tmp.name, 50, y_position - 220, width=500, height=180)
+                # Add part information
+                c.drawString(50, y_position, f"Part: {part['name']}")
+                c.drawString(50, y_position - 20, f"Quantity: {part['quantity']}")
+                
+                if mode == 'vector':
+                    # Add drawing to PDF as paths
+                    draw_dwg_vector(c, dwg_path, 50, y_position - 220, 500, 180, drawing_forms, drawing)
+                else:
+                    # One reader per drawing; it keeps the decoded pixels
+                    image_reader = image_readers.get(dwg_path)
+                    if image_reader is None:
+                        image_reader = ImageReader(drawing)
+                        image_readers[dwg_path] = image_reader
                     
-                    # Clean up temporary file
-                    os.unlink(tmp.name)
+                    # Add image to PDF straight from memory
+                    c.drawImage(image_reader, 50, y_position - 220, width=500, height=180)
                 
                 y_position -= 250
                 
@@ -110,7 +560,7 @@ def process_drawings(assemblies):
                     y_position = 700
                 
             except Exception as e:
-                print(f"Error processing part {part['name']}: {str(e)}")
+                logger.warning("Error processing part %s: %s", part['name'], e)
                 c.drawString(50, y_position, f"Error processing part {part['name']}: {str(e)}")
                 y_position -= 50
         
@@ -0,0 +1,54 @@
+import os
+from collections import namedtuple
+from reportlab.lib.utils import ImageReader
+from utils.cache import LRUCache
+
+CachedImage = namedtuple('CachedImage', ['reader', 'width', 'height'])
+
+
+class ImageCache:
+    """Process-wide cache of decoded drawing images.
+
+    Entries are keyed by file path and modification time, so replacing a
+    drawing in static/images is picked up on the next lookup.
+    """
+
+    def __init__(self, max_entries=64):
+        self._cache = LRUCache(max_entries)
+        self._versions = {}
+
+    def get(self, image_path):
+        """Return a CachedImage for image_path, or None if the file does not exist."""
+        try:
+            mtime = os.stat(image_path).st_mtime_ns
+        except OSError:
+            self._forget(image_path)
+            return None
+
+        key = (image_path, mtime)
+        entry = self._cache.get(key)
+        if entry is None:
+            reader = ImageReader(image_path)
+            width, height = reader.getSize()
+            entry = CachedImage(reader, width, height)
+            self._forget(image_path)
+            self._cache.put(key, entry)
+            self._versions[image_path] = mtime
+        return entry
+
+    def _forget(self, image_path):
+        # Drop the decoded copy of a drawing that was replaced or removed
+        old_mtime = self._versions.pop(image_path, None)
+        if old_mtime is not None:
+            self._cache.pop((image_path, old_mtime))
+
+    def clear(self):
+        self._cache.clear()
+        self._versions.clear()
+
+    def stats(self):
+        return self._cache.stats()
+
+
+# Shared by every PDFGenerator in the process; sized for every BOM drawing at each packet quality
+image_cache = ImageCache(max_entries=int(os.environ.get('IMAGE_CACHE_SIZE', 128)))
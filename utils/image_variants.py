@@ -0,0 +1,101 @@
+import hashlib
+import os
+import threading
+from PIL import Image
+from reportlab.lib.units import inch
+from utils.packet_layout import PAGE_SIZES, full_page_area
+
+# The largest area a packet draws a drawing into: a full-page drawing on the
+# largest sheet (9 x 14 in on tabloid). Compact tiles are never larger.
+MAX_DRAW_SIZE_INCHES = tuple(max(full_page_area(page_size)[axis] for page_size in PAGE_SIZES.values()) / inch
+                             for axis in (0, 1))
+
+# Packet quality settings. 'archive' embeds the source PNGs unchanged; the
+# others flatten the drawings onto white as grayscale (they are black line art),
+# cap their resolution at the given DPI for the largest draw size and keep
+# gray_bits bits per pixel. Fewer gray levels compress much better once
+# downscaling has anti-aliased the lines.
+QUALITY_PROFILES = {
+    'screen': {'dpi': 96, 'gray_bits': 4},
+    'print': {'dpi': 300, 'gray_bits': 8},
+    'archive': None
+}
+# What the packet form submits unless the user picks another quality
+DEFAULT_QUALITY = 'print'
+
+
+class ImageVariants:
+    """Print-optimized copies of the drawings in static/images, cached on disk.
+
+    Variants are stored as <source sha256>-<quality>-<max width>x<max height>.png,
+    so an edited drawing, or a new size cap, gets new variants and stale ones
+    are simply never looked up again.
+    """
+
+    def __init__(self, images_dir, cache_dir):
+        self.images_dir = images_dir
+        self.cache_dir = cache_dir
+        self._source_hashes = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def source_hash(self, source_path):
+        """SHA-256 of a drawing, memoized by path and mtime."""
+        mtime = os.stat(source_path).st_mtime_ns
+        cached = self._source_hashes.get(source_path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        digest = hashlib.sha256()
+        with open(source_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        source_hash = digest.hexdigest()
+        self._source_hashes[source_path] = (mtime, source_hash)
+        return source_hash
+
+    def get_path(self, image_name, quality):
+        """Return the path of the variant of image_name for quality.
+
+        Falls back to the source image for 'archive', unknown qualities and
+        drawings that don't exist (the caller reports those as missing).
+        """
+        source_path = os.path.join(self.images_dir, image_name)
+        profile = QUALITY_PROFILES.get(quality)
+        if profile is None or not os.path.exists(source_path):
+            return source_path
+
+        max_width, max_height = max_variant_size(profile)
+        variant_path = os.path.join(self.cache_dir, f"{self.source_hash(source_path)}-{quality}-{max_width}x{max_height}.png")
+        if not os.path.exists(variant_path):
+            with self._lock:
+                if not os.path.exists(variant_path):
+                    self.build_variant(source_path, variant_path, profile)
+        return variant_path
+
+    def build_variant(self, source_path, variant_path, profile):
+        with Image.open(source_path) as source:
+            image = source.convert('RGBA')
+
+        # Flatten transparency onto white paper, then drop to one gray channel
+        background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image).convert('L')
+
+        max_width, max_height = max_variant_size(profile)
+        if image.width > max_width or image.height > max_height:
+            image.thumbnail((max_width, max_height), Image.LANCZOS)
+
+        if profile['gray_bits'] < 8:
+            # Evenly spaced levels from black to white, so the paper stays white
+            top = (1 << profile['gray_bits']) - 1
+            image = image.point([round(round(v * top / 255) * 255 / top) for v in range(256)])
+
+        # Write under a temporary name so concurrent workers never read a partial file
+        partial_path = f"{variant_path}.{os.getpid()}.part"
+        image.save(partial_path, 'PNG', optimize=True)
+        os.replace(partial_path, variant_path)
+
+
+def max_variant_size(profile):
+    """Pixel size a variant is capped at: the largest draw size at the profile's DPI."""
+    return int(MAX_DRAW_SIZE_INCHES[0] * profile['dpi']), int(MAX_DRAW_SIZE_INCHES[1] * profile['dpi'])
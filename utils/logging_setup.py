@@ -0,0 +1,160 @@
+"""Structured, non-blocking logging for the packet generator.
+
+configure_logging() routes the root logger through a QueueHandler, so code
+that logs in a hot loop only enqueues a record; a QueueListener thread
+formats it (JSON by default) and writes it to stdout. Every record carries
+the current request id, and repeats of the same message within
+LOG_RATE_LIMIT_SECONDS are dropped and counted instead of written.
+
+Environment:
+    LOG_LEVEL                 minimum level (default: INFO)
+    LOG_FORMAT                'json' or 'text' (default: json)
+    LOG_RATE_LIMIT_SECONDS    window for suppressing repeats (default: 60, 0 disables)
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# Correlation id of the request (or job) being handled on this thread
+request_id_var = contextvars.ContextVar('request_id', default='-')
+
+# Distinct messages remembered for rate limiting
+RATE_LIMIT_MAX_KEYS = 1024
+
+# LogRecord attributes that aren't user-supplied extra fields
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'request_id'}
+
+_listener = None
+_handler = None
+_lock = threading.Lock()
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:12]
+
+
+def set_request_id(request_id=None):
+    """Set the correlation id for the current context and return it."""
+    request_id = request_id or new_request_id()
+    request_id_var.set(request_id)
+    return request_id
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the request id while still on the logging thread."""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Drops repeats of a message (same logger, template and arguments) within interval seconds.
+
+    The first record after the window reports how many repeats were dropped
+    as a 'suppressed' field.
+    """
+
+    def __init__(self, interval):
+        super().__init__()
+        self.interval = interval
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.interval <= 0:
+            return True
+        try:
+            key = (record.name, record.levelno, str(record.msg), repr(record.args))
+        except Exception:
+            return True
+
+        now = time.monotonic()
+        with self._lock:
+            state = self._seen.get(key)
+            if state is not None and now - state[0] < self.interval:
+                state[1] += 1
+                return False
+            if state is not None and state[1]:
+                record.suppressed = state[1]
+            self._seen[key] = [now, 0]
+            self._seen.move_to_end(key)
+            while len(self._seen) > RATE_LIMIT_MAX_KEYS:
+                self._seen.popitem(last=False)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with time, level, logger, message, request id and any extra fields."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', '-')
+        }
+        for name, value in vars(record).items():
+            if name not in STANDARD_ATTRIBUTES:
+                entry[name] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def build_formatter(log_format):
+    if log_format == 'text':
+        return logging.Formatter('%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s')
+    return JsonFormatter()
+
+
+def _start_listener():
+    global _listener
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(build_formatter(os.environ.get('LOG_FORMAT', 'json')))
+    _handler.queue = queue.Queue(-1)
+    _listener = logging.handlers.QueueListener(_handler.queue, output, respect_handler_level=False)
+    _listener.start()
+
+
+def _restart_after_fork():
+    # The listener thread doesn't survive fork; give the child its own queue and thread
+    global _lock
+    _lock = threading.Lock()
+    if _handler is not None:
+        _start_listener()
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def configure_logging():
+    """Install the queue handler on the root logger. Safe to call more than once."""
+    global _handler
+    with _lock:
+        if _handler is not None:
+            return
+        _handler = logging.handlers.QueueHandler(queue.Queue(-1))
+        _handler.addFilter(RequestIdFilter())
+        _handler.addFilter(RateLimitFilter(float(os.environ.get('LOG_RATE_LIMIT_SECONDS', 60))))
+        _start_listener()
+
+        root = logging.getLogger()
+        root.addHandler(_handler)
+        root.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+
+        atexit.register(_stop_listener)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=_restart_after_fork)
@@ -0,0 +1,64 @@
+"""Packet-level material summary.
+
+Adds up each part's quantity across every section of a board, so the floor
+gets one list of what to cut instead of totalling the per-section pages by
+hand. The same rows feed the summary pages at the front of a packet and the
+CSV/JSON exports.
+"""
+import csv
+import io
+import json
+
+CSV_COLUMNS = ('quantity', 'label', 'image', 'sections')
+
+
+def summarize_materials(section_boms, image_labels):
+    """Total every part across sections.
+
+    section_boms is a list of (section_number, section, section_images) as
+    returned by PDFGenerator.get_section_boms. Returns one row per image, in
+    order of first use: {'image', 'label', 'quantity', 'sections'}, where
+    sections lists the section numbers that use the part.
+    """
+    rows = {}
+    for section_number, section, section_images in section_boms:
+        for item in section_images:
+            row = rows.get(item.name)
+            if row is None:
+                row = rows[item.name] = {'image': item.name, 'label': image_labels.get(item.name, item.name),
+                                         'quantity': 0, 'sections': []}
+            row['quantity'] += item.quantity
+            if not row['sections'] or row['sections'][-1] != section_number:
+                row['sections'].append(section_number)
+    return list(rows.values())
+
+
+def format_sections(section_numbers):
+    """Compress section numbers into ranges: [1, 2, 3, 5, 7, 8] -> '1-3, 5, 7-8'."""
+    ranges = []
+    for number in section_numbers:
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return ', '.join(str(start) if start == end else f"{start}-{end}" for start, end in ranges)
+
+
+def summary_csv(rows):
+    """Material summary as CSV text, one row per part."""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(CSV_COLUMNS)
+    for row in rows:
+        writer.writerow((row['quantity'], row['label'], row['image'], format_sections(row['sections'])))
+    return output.getvalue()
+
+
+def summary_json(rows, board=None):
+    """Material summary as JSON text, with the board's header fields if given."""
+    data = {'parts': rows, 'total_quantity': sum(row['quantity'] for row in rows)}
+    if board is not None:
+        for field in ('sales_order', 'customer_name', 'job_address', 'switchboard_name'):
+            data[field] = board.get(field, '')
+        data['total_sections'] = board.total_sections
+    return json.dumps(data, indent=2)
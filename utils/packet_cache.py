@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+# Bump when a change to the generator alters the PDF produced for the same form
+PACKET_CACHE_VERSION = 3
+
+# Form fields that do not affect the rendered packet
+IGNORED_FIELDS = ('timestamp',)
+
+
+class PacketCache:
+    """Content-addressed cache of generated packets on disk.
+
+    A packet is keyed by a hash of the normalized form data and a fingerprint
+    of the drawings in static/images, so a reprint of the same board is served
+    from disk while an edited drawing produces a fresh packet. The directory is
+    kept under max_bytes by evicting the least recently used packets.
+
+    rules_fingerprint, if given, is called for a string that is mixed into
+    every key, so editing the BOM rules also produces fresh packets.
+    packet_quality, if given, is called with the form data for the quality
+    the packet is rendered at, so a form without packet_quality is keyed on
+    the generator's default (PDF_QUALITY) rather than shared across defaults.
+    """
+
+    def __init__(self, cache_dir, images_dir, max_bytes=500 * 1024 * 1024, rules_fingerprint=None,
+                 packet_quality=None):
+        self.cache_dir = cache_dir
+        self.images_dir = images_dir
+        self.max_bytes = max_bytes
+        self.rules_fingerprint = rules_fingerprint
+        self.packet_quality = packet_quality
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def images_fingerprint(self):
+        """Hash the name, size and mtime of every drawing in the images directory."""
+        digest = hashlib.sha256()
+        with os.scandir(self.images_dir) as entries:
+            for entry in sorted(entries, key=lambda e: e.name):
+                if entry.is_file():
+                    stat = entry.stat()
+                    digest.update(f"{entry.name}:{stat.st_size}:{stat.st_mtime_ns}\n".encode('utf-8'))
+        return digest.hexdigest()
+
+    def key_for(self, form_data):
+        """Return the cache key for a packet request."""
+        normalized = {k: v for k, v in form_data.items() if k not in IGNORED_FIELDS}
+        if self.packet_quality is not None:
+            normalized['packet_quality'] = self.packet_quality(form_data)
+        payload = json.dumps(normalized, sort_keys=True)
+        digest = hashlib.sha256()
+        digest.update(f"v{PACKET_CACHE_VERSION}\n".encode('utf-8'))
+        digest.update(payload.encode('utf-8'))
+        digest.update(self.images_fingerprint().encode('utf-8'))
+        if self.rules_fingerprint is not None:
+            digest.update(self.rules_fingerprint().encode('utf-8'))
+        return digest.hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def warnings_path_for(self, key):
+        return os.path.join(self.cache_dir, f"{key}.warnings.json")
+
+    def warnings_for(self, key):
+        """Return the warnings recorded when a cached packet was generated."""
+        try:
+            with open(self.warnings_path_for(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def get(self, key):
+        """Return the path of a cached packet, or None on a miss."""
+        path = self.path_for(key)
+        try:
+            # Touch the entry so eviction treats it as recently used
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def put(self, key, pdf_path):
+        """Move a freshly generated packet into the cache and return its new path."""
+        path = self.path_for(key)
+        shutil.move(pdf_path, path)
+        self.evict(keep=path)
+        return path
+
+    def put_stream(self, key, stream, warnings=None):
+        """Copy a packet from a binary file object into the cache and rewind the stream.
+        
+        warnings, the packet's generation warnings, are kept alongside it.
+        """
+        path = self.path_for(key)
+        if warnings:
+            # Written first so a cached packet never lacks its warnings
+            with open(self.warnings_path_for(key), 'w') as f:
+                json.dump(warnings, f)
+        # Write under a unique name, then rename so readers never see a partial packet
+        partial_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            with open(partial_path, 'wb') as f:
+                shutil.copyfileobj(stream, f)
+            os.replace(partial_path, path)
+        finally:
+            if os.path.exists(partial_path):
+                os.unlink(partial_path)
+        stream.seek(0)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        """Remove least recently used packets until the cache fits in max_bytes."""
+        with self._lock:
+            entries = []
+            total = 0
+            with os.scandir(self.cache_dir) as scan:
+                for entry in scan:
+                    if entry.is_file() and entry.name.endswith('.pdf'):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+                        total += stat.st_size
+
+            for mtime, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.unlink(path)
+                    total -= size
+                except OSError:
+                    continue
+                warnings_path = f"{path[:-len('.pdf')]}.warnings.json"
+                if os.path.exists(warnings_path):
+                    os.unlink(warnings_path)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0
+            }
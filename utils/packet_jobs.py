@@ -0,0 +1,249 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from utils.logging_setup import set_request_id
+from utils.switchboard import parse_switchboard
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+logger = logging.getLogger(__name__)
+
+
+class JobStore:
+    """SQLite-backed record of packet generation jobs, so the queue survives restarts."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    form_data TEXT NOT NULL,
+                    sections_done INTEGER NOT NULL DEFAULT 0,
+                    total_sections INTEGER NOT NULL DEFAULT 0,
+                    filename TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    owner_pid INTEGER,
+                    warnings TEXT,
+                    owner_token TEXT
+                )
+            ''')
+            # Stores created before jobs recorded their owning process and warnings
+            columns = [row['name'] for row in conn.execute('PRAGMA table_info(jobs)')]
+            if 'owner_pid' not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN owner_pid INTEGER')
+            if 'owner_token' not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN owner_token TEXT')
+            if 'warnings' not in columns:
+                conn.execute('ALTER TABLE jobs ADD COLUMN warnings TEXT')
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per call keeps the store safe to use from worker threads
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def create(self, form_data):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        total_sections = parse_switchboard(form_data).total_sections
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, status, form_data, total_sections, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, JOB_QUEUED, json.dumps(form_data), total_sections, now, now)
+            )
+        return job_id
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['form_data'] = json.loads(job['form_data'])
+        job['warnings'] = json.loads(job['warnings']) if job['warnings'] else []
+        return job
+
+    def claim(self, job_id):
+        """Mark a queued job as running. Returns False if another worker already has it."""
+        pid = os.getpid()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'UPDATE jobs SET status = ?, owner_pid = ?, owner_token = ?, updated_at = ? WHERE id = ? AND status = ?',
+                (JOB_RUNNING, pid, process_token(pid), time.time(), job_id, JOB_QUEUED)
+            )
+        return cursor.rowcount == 1
+
+    def update(self, job_id, **fields):
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        with self._connect() as conn:
+            conn.execute(f'UPDATE jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+
+    def requeue_unfinished(self):
+        """Put jobs interrupted by a restart back in the queue and return the queued ids.
+        
+        Only jobs whose worker process has exited are requeued, so this is safe
+        to call from every web worker while others are still running jobs.
+        """
+        with self._connect() as conn:
+            running = conn.execute('SELECT id, owner_pid, owner_token FROM jobs WHERE status = ?',
+                                   (JOB_RUNNING,)).fetchall()
+            for row in running:
+                if not _process_alive(row['owner_pid'], row['owner_token']):
+                    conn.execute('UPDATE jobs SET status = ?, sections_done = 0 WHERE id = ? AND status = ?',
+                                 (JOB_QUEUED, row['id'], JOB_RUNNING))
+            rows = conn.execute('SELECT id FROM jobs WHERE status = ? ORDER BY created_at', (JOB_QUEUED,)).fetchall()
+        return [row['id'] for row in rows]
+
+    def purge_finished(self, max_age):
+        """Delete done and failed jobs last updated more than max_age seconds ago.
+        
+        Returns the filenames of the purged jobs' packets, for the caller to remove.
+        """
+        cutoff = time.time() - max_age
+        with self._connect() as conn:
+            rows = conn.execute('SELECT id, filename FROM jobs WHERE status IN (?, ?) AND updated_at < ?',
+                                (JOB_DONE, JOB_FAILED, cutoff)).fetchall()
+            conn.executemany('DELETE FROM jobs WHERE id = ?', [(row['id'],) for row in rows])
+        return [row['filename'] for row in rows if row['filename']]
+
+
+def process_token(pid):
+    """Tell a process apart from a later one given the same PID, e.g. after a container restart.
+
+    The token is the kernel boot id and the process start time, so it
+    can't be reused by another process. None where /proc isn't available.
+    """
+    try:
+        with open('/proc/sys/kernel/random/boot_id') as f:
+            boot_id = f.read().strip()
+        with open(f'/proc/{pid}/stat') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # starttime is field 22; count from after the command name, which may contain spaces
+    return f"{boot_id}:{stat.rsplit(')', 1)[1].split()[19]}"
+
+
+def _process_alive(pid, token=None):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    # A live process with the job's PID may be a different one that reused it
+    return token is None or process_token(pid) == token
+
+
+class JobQueue:
+    """Runs packet generation jobs on a bounded pool of worker threads.
+
+    Finished and failed jobs, and their packets, are purged retention
+    seconds after they complete (never if retention is 0), checked whenever
+    a job is submitted or the queue recovers.
+    """
+
+    def __init__(self, pdf_generator, store, max_workers=2, retention=24 * 60 * 60):
+        self.pdf_generator = pdf_generator
+        self.store = store
+        self.max_workers = max_workers
+        self.retention = retention
+        self._executor = None
+        self._lock = threading.Lock()
+        self._recovered = False
+        # A forked web worker must not inherit the parent's (thread-less) pool
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        self._executor = None
+        self._lock = threading.Lock()
+        self._recovered = False
+
+    def _get_executor(self):
+        # Created on first use so the pool's threads start in the serving process
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='packet-job')
+            return self._executor
+
+    def submit(self, form_data):
+        self.purge_expired()
+        job_id = self.store.create(form_data)
+        self._get_executor().submit(self._run, job_id)
+        return job_id
+
+    def purge_expired(self):
+        """Delete jobs and packets older than the retention period."""
+        if self.retention <= 0:
+            return
+        for filename in self.store.purge_finished(self.retention):
+            try:
+                os.unlink(os.path.join(self.pdf_generator.output_dir, filename))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning("Could not remove expired job packet %s: %s", filename, e)
+
+    def recover(self):
+        """Resume jobs that were queued or running when the process last stopped."""
+        self.purge_expired()
+        job_ids = self.store.requeue_unfinished()
+        for job_id in job_ids:
+            self._get_executor().submit(self._run, job_id)
+        return job_ids
+
+    def ensure_recovered(self):
+        """Run recover() once per process; cheap to call on every request."""
+        if self._recovered:
+            return
+        with self._lock:
+            if self._recovered:
+                return
+            self._recovered = True
+        self.recover()
+
+    def _run(self, job_id):
+        # Log lines for the job carry its id as their correlation id
+        set_request_id(job_id)
+        if not self.store.claim(job_id):
+            return
+        job = self.store.get(job_id)
+        filename = f"packet_{job_id}.pdf"
+        output_path = os.path.join(self.pdf_generator.output_dir, filename)
+
+        def progress(sections_done, total_sections):
+            self.store.update(job_id, sections_done=sections_done, total_sections=total_sections)
+
+        warnings = []
+        try:
+            self.pdf_generator.generate_pdf(job['form_data'], output=output_path, progress=progress, warnings=warnings)
+            self.store.update(job_id, status=JOB_DONE, filename=filename, warnings=json.dumps(warnings))
+        except Exception as e:
+            logger.error("Error running packet job %s: %s", job_id, e)
+            if os.path.exists(output_path):
+                os.unlink(output_path)
+            # Keep what was reported before the failure; it often explains it
+            self.store.update(job_id, status=JOB_FAILED, error=str(e), warnings=json.dumps(warnings))
@@ -0,0 +1,379 @@
+"""Page layout for factory packets.
+
+The layout phase is pure: it turns resolved sections and their images into a
+page plan without touching a canvas. A page plan is a dict of the form
+
+    {
+        'pages': [
+            {'section': 1, 'section_type': 'Spectra', 'page_num': 1,
+             'items': [{'type': 'image', 'name': ..., 'x': ..., 'y': ..., 'width': ..., 'height': ...},
+                       {'type': 'text', 'text': ..., 'x': ..., 'y': ..., 'font': 'Helvetica-Bold', 'font_size': 12}]},
+            ...
+        ],
+        'sections': [{'section': 1, 'section_type': 'Spectra', 'pages': 4, 'images': [...]}, ...],
+        'front_pages': [{'section': None, 'title': 'Material Summary', 'page_num': 1, 'items': [...]}, ...],
+        'warnings': [...]
+    }
+
+Front pages (the material summary) are printed before the section pages and
+carry a title instead of a section number, as do the pages of the compact
+layout, where each drawing is tiled once for the whole board. 'page_size' is
+the plan's (width, height); layouts default to letter.
+
+Coordinates are in points with the origin at the bottom left of the page.
+"""
+from reportlab.lib.pagesizes import letter, elevenSeventeen
+from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from utils.material_summary import format_sections
+
+# Vertical band available for images between the section title (see
+# content_top) and the footer
+CONTENT_BOTTOM = 2*inch
+MARGIN = 1*inch
+
+# Sheets a packet can be laid out on
+PAGE_SIZES = {'letter': letter, 'tabloid': elevenSeventeen}
+DEFAULT_PAGE_SIZE = 'letter'
+
+# Safety limit to prevent infinite loops on images that never fit
+MAX_PAGES_PER_SECTION = 10
+
+# Material summary table: one row is the quantity and label, with the drawing
+# file and sections in small type underneath
+SUMMARY_ROW_HEIGHT = 0.4*inch
+SUMMARY_MAX_DETAIL_CHARS = 120
+SUMMARY_TITLE = 'Material Summary'
+
+# Compact layout: drawings are fitted into grid cells of at most TILE_HEIGHT
+# (MLO ABC/neutral drawings span the full width, up to LARGE_TILE_HEIGHT),
+# with two lines of text underneath, and packed into rows tallest first
+COMPACT_TITLE = 'Drawings'
+TILE_HEIGHT = 2.25*inch
+LARGE_TILE_HEIGHT = 4.5*inch
+TILE_GAP = 0.25*inch
+TILE_LABEL_HEIGHT = 0.45*inch
+MIN_TILE_WIDTH = 2.5*inch
+
+FULL_PAGE_PREFIXES = ('mlo2bar4inch', 'mlo3bar4inch', 'mlo4bar4inch')
+FULL_PAGE_SUFFIXES = ('abc.png', 'neutral.png')
+
+
+def is_full_page_image(image_name):
+    """MLO ABC and neutral bus drawings get a page of their own."""
+    return image_name.startswith(FULL_PAGE_PREFIXES) and \
+        any(suffix in image_name for suffix in FULL_PAGE_SUFFIXES)
+
+
+def content_top(page_size):
+    return page_size[1] - 2*inch
+
+
+def fit_within(img_width, img_height, max_width, max_height):
+    """Scale an image to fit a box while keeping its aspect ratio."""
+    scale = min(max_width / img_width, max_height / img_height)
+    return img_width * scale, img_height * scale
+
+
+def full_page_area(page_size):
+    """The (width, height) a full-page drawing fills, the largest box any layout draws into."""
+    # Margins at the sides, room for the header and footer above and below
+    return page_size[0] - 2*MARGIN, page_size[1] - 3*inch
+
+
+def fit_full_page(img_width, img_height, page_size=letter):
+    """Size an image to fill the content area while keeping its aspect ratio."""
+    aspect = img_height / img_width
+    available_width, available_height = full_page_area(page_size)
+
+    if aspect > available_height/available_width:
+        # Height limited
+        display_height = available_height
+        display_width = display_height / aspect
+    else:
+        # Width limited
+        display_width = available_width
+        display_height = display_width * aspect
+    return display_width, display_height
+
+
+def fit_stacked(img_width, img_height, y_position, page_size=letter):
+    """Size an image so that at least two fit on a page, within min/max bounds."""
+    aspect = img_height / img_width
+
+    # Calculate maximum display height to ensure at least 2 images per page
+    available_height = y_position - CONTENT_BOTTOM
+    max_display_height = available_height / 2
+
+    # Calculate display width based on aspect ratio and max height
+    display_height = min(max_display_height, 4*inch)  # Cap at 4 inches
+    display_width = display_height / aspect
+
+    # Set minimum size constraints
+    min_height = 2.5*inch
+    min_width = 3*inch
+
+    # If height is too small, adjust both dimensions proportionally
+    if display_height < min_height:
+        display_height = min_height
+        display_width = display_height / aspect
+
+    # If width is too small after height adjustment, adjust both dimensions
+    if display_width < min_width:
+        display_width = min_width
+        display_height = display_width * aspect
+
+    # If width is too large, scale down proportionally
+    max_width = page_size[0] - 2.5*inch
+    if display_width > max_width:
+        display_width = max_width
+        display_height = display_width * aspect
+    return display_width, display_height
+
+
+def layout_section(section_number, section_type, section_images, get_image_size, image_labels, page_size=letter):
+    """Paginate one section's images.
+
+    section_images is a sequence of BOM items with name and quantity.
+    get_image_size(name) returns (width, height) in pixels, or None if the
+    image does not exist. It may raise if the image cannot be read.
+    Returns (pages, warnings).
+    """
+    pages = []
+    warnings = []
+
+    def new_page(page_num):
+        page = {'section': section_number, 'section_type': section_type, 'page_num': page_num, 'items': []}
+        pages.append(page)
+        return page
+
+    # Start with the first page for this section
+    page_num = 1
+    images_processed = 0
+    pages_created = 0
+
+    while images_processed < len(section_images) and pages_created < MAX_PAGES_PER_SECTION:
+        pages_created += 1
+        page = new_page(page_num)
+        y_position = content_top(page_size)
+
+        while images_processed < len(section_images) and y_position > CONTENT_BOTTOM:
+            img = section_images[images_processed]
+
+            # Check if this is a bus size text entry
+            if img.name.startswith('Bus Size:'):
+                page['items'].append({'type': 'text', 'text': img.name, 'x': 1*inch, 'y': y_position - 0.3*inch,
+                                      'font': 'Helvetica-Bold', 'font_size': 12})
+                y_position -= 0.5*inch
+                images_processed += 1
+                continue
+
+            try:
+                size = get_image_size(img.name)
+            except Exception as e:
+                warnings.append(f"Error adding image {img.name} for section {section_number}: {str(e)}")
+                images_processed += 1
+                continue
+
+            if size is None:
+                warnings.append(f"Image not found: {img.name}")
+                images_processed += 1
+                continue
+
+            if is_full_page_image(img.name):
+                display_width, display_height = fit_full_page(size[0], size[1], page_size)
+
+                # Center the image horizontally
+                x_position = (page_size[0] - display_width) / 2
+                page['items'].append({'type': 'image', 'name': img.name, 'x': x_position,
+                                      'y': y_position - display_height,
+                                      'width': display_width, 'height': display_height})
+
+                # Start a new page after each MLO ABC/neutral image
+                page_num += 1
+                page = new_page(page_num)
+                y_position = content_top(page_size)
+            else:
+                display_width, display_height = fit_stacked(size[0], size[1], y_position, page_size)
+
+                if y_position - display_height < CONTENT_BOTTOM:
+                    # Not enough space, start a new page
+                    break
+
+                page['items'].append({'type': 'image', 'name': img.name, 'x': 1*inch,
+                                      'y': y_position - display_height,
+                                      'width': display_width, 'height': display_height})
+
+                # Add quantity and label under the image
+                label = image_labels.get(img.name, img.name)
+                page['items'].append({'type': 'text', 'text': f"QTY: {img.quantity} - {label}",
+                                      'x': 1*inch, 'y': y_position - display_height - 0.3*inch,
+                                      'font': 'Helvetica-Bold', 'font_size': 12})
+
+                # Update y_position for next image
+                y_position -= display_height + 0.5*inch
+
+            images_processed += 1
+
+        if images_processed < len(section_images):
+            page_num += 1
+
+    if images_processed < len(section_images):
+        warnings.append(f"Hit maximum page limit ({MAX_PAGES_PER_SECTION}) for section {section_number}. "
+                        f"{len(section_images) - images_processed} images not processed.")
+
+    return pages, warnings
+
+
+def layout_summary(rows, total_sections, page_size=letter):
+    """Paginate material summary rows (see utils.material_summary) into front pages."""
+    pages = []
+    page = None
+    y_position = CONTENT_BOTTOM
+    for row in rows:
+        if y_position - SUMMARY_ROW_HEIGHT < CONTENT_BOTTOM:
+            page = {'section': None, 'title': SUMMARY_TITLE, 'page_num': len(pages) + 1, 'items': []}
+            pages.append(page)
+            y_position = content_top(page_size)
+            if len(pages) == 1:
+                total_quantity = sum(r['quantity'] for r in rows)
+                page['items'].append({'type': 'text', 'x': 1*inch, 'y': y_position - 0.1*inch,
+                                      'text': f"{len(rows)} parts, {total_quantity} pieces across {total_sections} sections",
+                                      'font': 'Helvetica', 'font_size': 10})
+                y_position -= 0.4*inch
+            page['items'].append({'type': 'text', 'text': 'QTY', 'x': 1*inch, 'y': y_position - 0.1*inch,
+                                  'font': 'Helvetica-Bold', 'font_size': 10})
+            page['items'].append({'type': 'text', 'text': 'PART', 'x': 1.6*inch, 'y': y_position - 0.1*inch,
+                                  'font': 'Helvetica-Bold', 'font_size': 10})
+            y_position -= 0.3*inch
+
+        detail = f"{row['image']}    Sections: {format_sections(row['sections'])}"
+        if len(detail) > SUMMARY_MAX_DETAIL_CHARS:
+            detail = detail[:SUMMARY_MAX_DETAIL_CHARS - 3] + '...'
+        page['items'].append({'type': 'text', 'text': str(row['quantity']), 'x': 1*inch, 'y': y_position - 0.1*inch,
+                              'font': 'Helvetica-Bold', 'font_size': 10})
+        page['items'].append({'type': 'text', 'text': row['label'], 'x': 1.6*inch, 'y': y_position - 0.1*inch,
+                              'font': 'Helvetica', 'font_size': 10})
+        page['items'].append({'type': 'text', 'text': detail, 'x': 1.6*inch, 'y': y_position - 0.25*inch,
+                              'font': 'Helvetica', 'font_size': 7})
+        y_position -= SUMMARY_ROW_HEIGHT
+    return pages
+
+
+def truncate_text(text, font, font_size, width):
+    """Shorten text with '...' so it fits width points."""
+    if stringWidth(text, font, font_size) <= width:
+        return text
+    while text and stringWidth(text + '...', font, font_size) > width:
+        text = text[:-1]
+    return text + '...'
+
+
+def format_section_uses(uses):
+    """Cross-reference for a drawing from its (section_number, quantity) uses.
+
+    [(1, 6), (2, 6), (3, 2)] -> 'Sections 1-2 (6 each); 3 (2 each)'
+    """
+    by_quantity = {}
+    for section_number, quantity in uses:
+        by_quantity.setdefault(quantity, []).append(section_number)
+    return 'Sections ' + '; '.join(f"{format_sections(numbers)} ({quantity} each)"
+                                   for quantity, numbers in by_quantity.items())
+
+
+def layout_compact(sections, get_image_size, image_labels, page_size=letter):
+    """Tile every distinct drawing of the board once, with a cross-reference to the sections using it.
+
+    Drawings are fitted into grid cells (two columns on letter, three on
+    tabloid) and packed first-fit by decreasing height into rows, so short
+    drawings share rows with each other. Returns (pages, warnings); pages
+    carry the COMPACT_TITLE instead of a section number.
+    """
+    # Each drawing once, in order of first use, with the sections that use it
+    uses = {}
+    for section_number, section, section_images in sections:
+        for item in section_images:
+            uses.setdefault(item.name, []).append((section_number, item.quantity))
+
+    content_width = page_size[0] - 2*MARGIN
+    columns = max(1, int((content_width + TILE_GAP) // (MIN_TILE_WIDTH + TILE_GAP)))
+    cell_width = (content_width - (columns - 1) * TILE_GAP) / columns
+
+    tiles = []
+    warnings = []
+    for name, image_uses in uses.items():
+        try:
+            size = get_image_size(name)
+        except Exception as e:
+            warnings.append(f"Error adding image {name}: {str(e)}")
+            continue
+        if size is None:
+            warnings.append(f"Image not found: {name}")
+            continue
+        span = columns if is_full_page_image(name) else 1
+        tile_width = span * cell_width + (span - 1) * TILE_GAP
+        width, height = fit_within(size[0], size[1], tile_width,
+                                   LARGE_TILE_HEIGHT if span > 1 else TILE_HEIGHT)
+        tiles.append({'name': name, 'uses': image_uses, 'span': span, 'tile_width': tile_width,
+                      'width': width, 'height': height})
+
+    # First fit decreasing height: every row is as tall as its first tile
+    tiles.sort(key=lambda tile: tile['height'], reverse=True)
+    pages = []
+    rows = []
+    for tile in tiles:
+        row = next((row for row in rows if row['columns_used'] + tile['span'] <= columns), None)
+        if row is None:
+            row_height = tile['height'] + TILE_LABEL_HEIGHT
+            page = pages[-1] if pages else None
+            if page is None or page['next_top'] - row_height < CONTENT_BOTTOM:
+                page = {'section': None, 'title': COMPACT_TITLE, 'page_num': len(pages) + 1, 'items': [],
+                        'next_top': content_top(page_size)}
+                pages.append(page)
+            row = {'page': page, 'top': page['next_top'], 'columns_used': 0}
+            page['next_top'] -= row_height + TILE_GAP
+            rows.append(row)
+
+        x = MARGIN + row['columns_used'] * (cell_width + TILE_GAP)
+        y = row['top'] - tile['height']
+        row['columns_used'] += tile['span']
+        total_quantity = sum(quantity for section_number, quantity in tile['uses'])
+        label = f"QTY {total_quantity} - {image_labels.get(tile['name'], tile['name'])}"
+        row['page']['items'].extend([
+            {'type': 'image', 'name': tile['name'], 'x': x, 'y': y, 'width': tile['width'], 'height': tile['height']},
+            {'type': 'text', 'text': truncate_text(label, 'Helvetica-Bold', 9, tile['tile_width']),
+             'x': x, 'y': y - 0.17*inch, 'font': 'Helvetica-Bold', 'font_size': 9},
+            {'type': 'text', 'text': truncate_text(format_section_uses(tile['uses']), 'Helvetica', 7, tile['tile_width']),
+             'x': x, 'y': y - 0.32*inch, 'font': 'Helvetica', 'font_size': 7}
+        ])
+
+    for page in pages:
+        del page['next_top']
+    return pages, warnings
+
+
+def layout_packet(sections, get_image_size, image_labels, detail_pages=True, compact=False, page_size=letter):
+    """Build the page plan for a packet.
+
+    sections is a list of (section_number, section, section_images) where
+    section has at least a section_type (see utils.switchboard.Section).
+    With detail_pages False the sections are listed but get no pages. With
+    compact True the board's drawings are tiled once (see layout_compact)
+    instead of paginated per section.
+    """
+    plan = {'pages': [], 'sections': [], 'front_pages': [], 'warnings': [], 'page_size': tuple(page_size)}
+    if compact and detail_pages:
+        plan['pages'], plan['warnings'] = layout_compact(sections, get_image_size, image_labels, page_size)
+        detail_pages = False
+    for section_number, section, section_images in sections:
+        if not detail_pages:
+            plan['sections'].append({'section': section_number, 'section_type': section.section_type,
+                                     'pages': 0, 'images': section_images})
+            continue
+        pages, warnings = layout_section(section_number, section.section_type, section_images,
+                                         get_image_size, image_labels, page_size)
+        plan['pages'].extend(pages)
+        plan['warnings'].extend(warnings)
+        plan['sections'].append({'section': section_number, 'section_type': section.section_type,
+                                 'pages': len(pages), 'images': section_images})
+    return plan
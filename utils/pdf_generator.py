@@ -1,517 +1,577 @@
+import io
+import logging
+import multiprocessing
 import os
+import tempfile
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.units import inch
-from reportlab.lib.utils import ImageReader
 from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import Paragraph
-from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
+from utils.bom_rules import bom_rules
+from utils.image_cache import image_cache
+from utils.image_variants import ImageVariants, QUALITY_PROFILES, DEFAULT_QUALITY
+from utils.metrics import Counter, Histogram, PhaseTimer, SIZE_BUCKETS
+from utils.material_summary import summarize_materials
+from utils.packet_layout import layout_packet, layout_summary, PAGE_SIZES, DEFAULT_PAGE_SIZE
+from utils.pdf_merge import merge_pdfs
+from utils.switchboard import parse_switchboard
+
+logger = logging.getLogger(__name__)
+
+# Packet size model used by preview_packet, fitted against rendered packets
+# (every contents, layout, page size and quality; within 12%, about 3% on
+# average): a fixed cost per packet, a cost per section page and per
+# summary page, plus each distinct drawing's source PNG size times a ratio
+# for the packet quality
+ESTIMATED_PACKET_BYTES = 1830
+ESTIMATED_BYTES_PER_PAGE = 900
+ESTIMATED_BYTES_PER_SUMMARY_PAGE = 975
+ESTIMATED_IMAGE_BYTES_RATIO = {'screen': 0.56, 'print': 0.54, 'archive': 0.86}
+
+# Packet generation metrics, exposed on /metrics
+PACKETS_GENERATED = Counter('packets_generated_total', 'Packets generated, by outcome', ['status'])
+PACKET_SECONDS = Histogram('packet_generation_seconds', 'Time to generate a packet', ['mode'])
+PACKET_PHASE_SECONDS = Histogram('packet_phase_seconds', 'Time per packet spent in each generation phase', ['phase'])
+PACKET_PAGES = Histogram('packet_pages', 'Pages per packet', buckets=(1, 5, 10, 25, 50, 100, 250, 500))
+PACKET_BYTES = Histogram('packet_output_bytes', 'Size of generated packets in bytes', buckets=SIZE_BUCKETS)
+
+# What a packet holds: the material summary and the per-section pages ('full'),
+# only the summary, or only the section pages
+PACKET_CONTENTS = ('full', 'summary', 'sections')
+DEFAULT_PACKET_CONTENTS = 'full'
+
+# 'standard' paginates each section's drawings; 'compact' tiles every distinct
+# drawing once with a cross-reference to the sections using it
+PACKET_LAYOUTS = ('standard', 'compact')
+DEFAULT_PACKET_LAYOUT = 'standard'
+
+
+# Form XObject holding the furniture shared by every page of a packet
+PAGE_TEMPLATE_FORM = 'page_furniture'
+
+
+def position_class(section_number, total_sections):
+    """Classify a section as the first, a middle or the last section of the lineup."""
+    if section_number == 1:
+        return 'first'
+    if section_number == total_sections:
+        return 'last'
+    return 'middle'
+
+
+# Generator used by section worker processes, created on first use in each worker
+_fragment_generator = None
+
+
+def _render_fragment(plan, form_data, embed_mode):
+    """Render a page plan in a worker process and return (PDF bytes, warnings)."""
+    global _fragment_generator
+    if _fragment_generator is None:
+        _fragment_generator = PDFGenerator()
+    
+    buffer = io.BytesIO()
+    warnings = []
+    c = canvas.Canvas(buffer, pagesize=plan['page_size'])
+    _fragment_generator.render_plan(c, plan, form_data, embed_mode, warnings=warnings)
+    c.save()
+    return buffer.getvalue(), warnings
+
+
+def packet_filename(form_data, document='Factory Packet', extension='pdf'):
+    """Download name for a packet: Sales Order - Customer - Switchboard - Factory Packet.pdf"""
+    # Clean the values to make them safe for filenames
+    parts = []
+    for field in ('sales_order', 'customer_name', 'switchboard_name'):
+        value = form_data.get(field, 'Unknown')
+        parts.append(''.join(c for c in value if c.isalnum() or c in ' -_'))
+    return f"{parts[0]} - {parts[1]} - {parts[2]} - {document}.{extension}"
+
 
 class PDFGenerator:
-    def __init__(self):
+    def __init__(self, check_images=False):
         self.output_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'output')
         self.images_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static', 'images')
         os.makedirs(self.output_dir, exist_ok=True)
         os.makedirs(self.images_dir, exist_ok=True)
         
-        # Image name to label mapping
-        self.image_labels = {
-            '38x4spectraHorizontalABC.png': 'Spectra Horizontal ABC',
-            '38x4spectraHorizontalNuetral.png': 'Spectra Horizontal Neutral',
-            '43x4spectraHorizontalABC.png': 'Spectra Horizontal ABC',
-            '43x4spectraHorizontalNuetral.png': 'Spectra Horizontal Neutral',
-            '95x4spectraBLink.png': 'Spectra B-Link',
-            '115x4spectraACLink1.png': 'Spectra AC-Link 1',
-            '115x4spectraACLink2.png': 'Spectra AC-Link 2',
-            '1225x4spectraACPhaseVerticalLink4in.png': 'Spectra AC Phase Vertical Link',
-            '44375SpectraInnerSteel44Wide.png': 'Spectra Inner Steel 44" Wide',
-            '44375SpectraInnerSteel44WideSideView.png': 'Spectra Inner Steel 44" Wide Side View',
-            '36x4MLOHorizontalABC.png': 'MLO Horizontal ABC',
-            '36x4MLOHorizontalNuetral.png': 'MLO Horizontal Neutral',
-            '95x4MLOBLink.png': 'MLO B-Link',
-            '115x4MLOACLink1.png': 'MLO AC-Link 1',
-            '115x4MLOACLink2.png': 'MLO AC-Link 2',
-            '1225x4MLOACPhaseVerticalLink4in.png': 'MLO AC Phase Vertical Link',
-            '675x4SpectraHorizontalConnection4BarStack30deep.png': 'Spectra Horizontal Connection 4 Bar Stack 30" Deep',
-            '725x4SpectraHorizontalConnection3BarStack30deep.png': 'Spectra Horizontal Connection 3 Bar Stack 30" Deep',
-            '775x4SpectraHorizontalConnection2BarStack30deep.png': 'Spectra Horizontal Connection 2 Bar Stack 30" Deep',
-            '825x4SpectraHorizontalConnection1BarStack30Deep.png': 'Spectra Horizontal Connection 1 Bar Stack 30" Deep',
-            '1275x4SpectraHorizontalConnection4BarStack36deep.png': 'Spectra Horizontal Connection 4 Bar Stack 36" Deep',
-            '1325x4SpectraHorizontalConnection3BarStack36deep.png': 'Spectra Horizontal Connection 3 Bar Stack 36" Deep',
-            '1375x4SpectraHorizontalConnection2BarStack36deep.png': 'Spectra Horizontal Connection 2 Bar Stack 36" Deep',
-            '1425x4SpectraHorizontalConnection1BarStack36deep.png': 'Spectra Horizontal Connection 1 Bar Stack 36" Deep',
-            'mlo2bar4inchabc.png': 'MLO 2 Bar 4" ABC',
-            'mlo2bar4inchneutral.png': 'MLO 2 Bar 4" Neutral',
-            'mlo3bar4inchabc.png': 'MLO 3 Bar 4" ABC',
-            'mlo3bar4inchneutral.png': 'MLO 3 Bar 4" Neutral',
-            'mlo4bar4inchabc.png': 'MLO 4 Bar 4" ABC',
-            'mlo4bar4inchneutral.png': 'MLO 4 Bar 4" Neutral',
-            'mlo4bar4inchcphaseextra1.png': 'MLO 4 Bar 4" C Phase Extra 1',
-            'mlo4bar4inchcphaseextra2.png': 'MLO 4 Bar 4" C Phase Extra 2',
-            '36375MLOInnerSteel36Wide.png': 'MLO Inner Steel 36" Wide',
-            '44375SpectraInnerSteel44WideSideView.png': 'MLO Inner Steel 36" Wide Side View'
-        }
+        # Decoded drawings are shared across requests
+        self.image_cache = image_cache
+        
+        # Downscaled grayscale copies of the drawings for the screen/print qualities
+        self.image_variants = ImageVariants(self.images_dir, os.path.join(self.output_dir, 'image_variants'))
+        self.default_quality = os.environ.get('PDF_QUALITY', DEFAULT_QUALITY)
+        
+        # 'shared' embeds each drawing once per packet as a form XObject,
+        # 'inline' calls drawImage for every occurrence
+        self.embed_mode = 'shared'
+        
+        # Render sections on a process pool and merge them (PDF_PARALLEL_SECTIONS=1)
+        self.parallel_sections = os.environ.get('PDF_PARALLEL_SECTIONS', '0') == '1'
+        self.section_workers = int(os.environ.get('PDF_SECTION_WORKERS', os.cpu_count() or 1))
+        self._section_pool = None
+        self._section_pool_lock = threading.Lock()
+        
+        # Streamed packets larger than this are spilled to disk while they are sent
+        self.spool_threshold = int(os.environ.get('PDF_SPOOL_THRESHOLD', 32 * 1024 * 1024))
+        
+        # Section BOMs and drawing labels, from config/bom_rules.json
+        self.bom_rules = bom_rules
+        if check_images:
+            self.check_images()
+
+    @property
+    def image_labels(self):
+        """Image name to label mapping."""
+        return self.bom_rules.current().labels
+
+    def get_bom_image_names(self):
+        """Return every image any section configuration can use."""
+        return self.bom_rules.current().image_names()
+
+    def check_images(self):
+        """Return the images referenced by the BOM table that are missing from static/images."""
+        required_images = self.get_bom_image_names()
+        
+        missing_images = [img for img in required_images if not os.path.exists(os.path.join(self.images_dir, img))]
+        if missing_images:
+            logger.warning("Missing %d required images", len(missing_images), extra={'images': missing_images})
+        return missing_images
 
     def get_section_images(self, section_number, total_sections, section_type, width, amperage, depth, bus_size):
-        """Get the images for a given section based on its configuration."""
-        images = []
-        
-        if section_type == 'MLO':
-            # Verify all required MLO images exist before proceeding
-            required_images = [
-                'mlo2bar4inchabc.png',
-                'mlo2bar4inchneutral.png',
-                'mlo3bar4inchabc.png',
-                'mlo3bar4inchneutral.png',
-                'mlo4bar4inchabc.png',
-                'mlo4bar4inchneutral.png',
-                'mlo4bar4inchcphaseextra1.png',
-                'mlo4bar4inchcphaseextra2.png',
-                '36375MLOInnerSteel36Wide.png',
-                '44375SpectraInnerSteel44WideSideView.png'
-            ]
-            
-            missing_images = [img for img in required_images if not os.path.exists(os.path.join(self.images_dir, img))]
-            if missing_images:
-                print(f"WARNING: Missing required MLO images: {missing_images}")
-            
-            # Add MLO-specific images based on amperage
-            if amperage in ['1200', '2000']:
-                images.append({
-                    'name': 'mlo2bar4inchabc.png',
-                    'quantity': self.get_quantity_for_amperage(amperage, is_abc=True)
-                })
-                images.append({
-                    'name': 'mlo2bar4inchneutral.png',
-                    'quantity': self.get_quantity_for_amperage(amperage, is_abc=False)
-                })
-            elif amperage in ['2500', '3000']:
-                images.append({
-                    'name': 'mlo3bar4inchabc.png',
-                    'quantity': self.get_quantity_for_amperage(amperage, is_abc=True)
-                })
-                images.append({
-                    'name': 'mlo3bar4inchneutral.png',
-                    'quantity': self.get_quantity_for_amperage(amperage, is_abc=False)
-                })
-            elif amperage == '4000':
-                images.append({
-                    'name': 'mlo4bar4inchabc.png',
-                    'quantity': self.get_quantity_for_amperage(amperage, is_abc=True)
-                })
-                images.append({
-                    'name': 'mlo4bar4inchneutral.png',
-                    'quantity': self.get_quantity_for_amperage(amperage, is_abc=False)
-                })
-            
-            # Add common MLO images
-            images.append({
-                'name': 'mlo4bar4inchcphaseextra1.png',
-                'quantity': 1
-            })
-            images.append({
-                'name': 'mlo4bar4inchcphaseextra2.png',
-                'quantity': 1
-            })
-            
-            # Add inner steel images - updated quantity to 2
-            images.append({
-                'name': '36375MLOInnerSteel36Wide.png',
-                'quantity': 2
-            })
-            images.append({
-                'name': '44375SpectraInnerSteel44WideSideView.png',
-                'quantity': 1
-            })
-            
-            # MLO sections do not have B-links, AC-links, or connection bar stacks
-            
-        elif section_type == 'Spectra':
-            # Check if this is a first or last section
-            is_first_or_last = section_number == 1 or section_number == total_sections
-            
-            # Add ABC and Neutral images for first/last sections
-            if is_first_or_last:
-                if width == '44' or width == '40':
-                    images.append({
-                        'name': '38x4spectraHorizontalABC.png',
-                        'quantity': self.get_quantity_for_amperage(amperage, is_abc=True)
-                    })
-                    images.append({
-                        'name': '38x4spectraHorizontalNuetral.png',
-                        'quantity': self.get_quantity_for_amperage(amperage, is_abc=False)
-                    })
-            else:
-                # Middle section images
-                if width == '44' or width == '40':
-                    images.append({
-                        'name': '43x4spectraHorizontalABC.png',
-                        'quantity': self.get_quantity_for_amperage(amperage, is_abc=True)
-                    })
-                    images.append({
-                        'name': '43x4spectraHorizontalNuetral.png',
-                        'quantity': self.get_quantity_for_amperage(amperage, is_abc=False)
-                    })
-            
-            # Add B-link images (2 per section)
-            images.append({
-                'name': '95x4spectraBLink.png',
-                'quantity': 2
-            })
+        """Get the images for a given section based on its configuration.
+        
+        Returns an immutable tuple of BOMItem shared by every section with the same configuration.
+        """
+        key = (section_type, width, amperage, depth, bus_size, position_class(section_number, total_sections))
+        return self.lookup_bom(key)
+
+    def get_section_bom(self, section, position, rules=None):
+        """Return the BOM of a Section at a lineup position (first/middle/last)."""
+        rules = rules or self.bom_rules.current()
+        return rules.lookup((section.section_type, section.width, section.amperage, section.depth,
+                             section.bus_size, position))
+
+    def lookup_bom(self, key):
+        """Return the BOM for (section_type, width, amperage, depth, bus_size, position)."""
+        return self.bom_rules.current().lookup(key)
+
+    def draw_image(self, c, image_name, cached_image, x, y, width, height, shared_forms=None):
+        """Draw an image, reusing a per-packet form XObject when shared_forms is given."""
+        if shared_forms is None:
+            c.drawImage(cached_image.reader, x, y, width=width, height=height, preserveAspectRatio=True)
+            return
+        
+        form_name = shared_forms.get(image_name)
+        if form_name is None:
+            # Register the drawing once at its native size
+            form_name = 'img_' + ''.join(ch for ch in image_name if ch.isalnum())
+            c.beginForm(form_name, 0, 0, cached_image.width, cached_image.height)
+            c.drawImage(cached_image.reader, 0, 0, width=cached_image.width, height=cached_image.height)
+            c.endForm()
+            shared_forms[image_name] = form_name
+        
+        c.saveState()
+        c.translate(x, y)
+        c.scale(width / cached_image.width, height / cached_image.height)
+        c.doForm(form_name)
+        c.restoreState()
+
+    def get_switchboard(self, form_data):
+        """Parse form data or a JSON definition into a Switchboard (a Switchboard is returned as is)."""
+        return parse_switchboard(form_data)
+
+    def get_image_size(self, image_name):
+        """Return the pixel size of a drawing, or None if it does not exist."""
+        cached_image = self.image_cache.get(os.path.join(self.images_dir, image_name))
+        if cached_image is None:
+            return None
+        return cached_image.width, cached_image.height
+
+    def get_section_boms(self, form_data, timer=None):
+        """Return (section_number, section, section_images) for every section of the board."""
+        timer = timer or PhaseTimer()
+        with timer.phase('parse_form'):
+            board = self.get_switchboard(form_data)
+        
+        sections = []
+        with timer.phase('bom'):
+            # One version of the rules for the whole packet, even if they reload meanwhile
+            rules = self.bom_rules.current()
+            total_sections = board.total_sections
+            for section_number, section in board.numbered_sections():
+                section_images = self.get_section_bom(section, position_class(section_number, total_sections), rules)
+                sections.append((section_number, section, section_images))
+        return sections
+
+    def get_quality(self, form_data):
+        """Return the packet's image quality setting (screen/print/archive)."""
+        quality = form_data.get('packet_quality') or self.default_quality
+        return quality if quality in QUALITY_PROFILES else self.default_quality
+
+    def get_packet_contents(self, form_data):
+        """Return which pages the packet holds (full/summary/sections)."""
+        contents = form_data.get('packet_contents') or DEFAULT_PACKET_CONTENTS
+        return contents if contents in PACKET_CONTENTS else DEFAULT_PACKET_CONTENTS
+
+    def get_packet_layout(self, form_data):
+        """Return the packet's layout mode (standard/compact)."""
+        layout = form_data.get('packet_layout') or DEFAULT_PACKET_LAYOUT
+        return layout if layout in PACKET_LAYOUTS else DEFAULT_PACKET_LAYOUT
+
+    def get_page_size(self, form_data):
+        """Return the packet's page size in points for its page_size setting (letter/tabloid)."""
+        return PAGE_SIZES.get(form_data.get('page_size') or DEFAULT_PAGE_SIZE, PAGE_SIZES[DEFAULT_PAGE_SIZE])
+
+    def material_summary(self, form_data):
+        """Return the board's parts totalled across sections (see utils.material_summary)."""
+        return summarize_materials(self.get_section_boms(form_data), self.image_labels)
+
+    def preload_images(self, image_names, quality=None):
+        """Decode drawings into the shared image cache ahead of rendering."""
+        quality = quality or self.default_quality
+        for image_name in image_names:
+            cached_image = self.image_cache.get(self.image_variants.get_path(image_name, quality))
+            if cached_image is not None:
+                cached_image.reader.getRGBData()
+
+    def plan_packet(self, form_data, timer=None):
+        """Resolve sections and paginate them without drawing anything."""
+        timer = timer or PhaseTimer()
+        contents = self.get_packet_contents(form_data)
+        section_boms = self.get_section_boms(form_data, timer)
+        with timer.phase('layout'):
+            image_labels = self.image_labels
+            page_size = self.get_page_size(form_data)
+            plan = layout_packet(section_boms, self.get_image_size, image_labels, detail_pages=contents != 'summary',
+                                 compact=self.get_packet_layout(form_data) == 'compact', page_size=page_size)
+            if contents != 'sections':
+                plan['front_pages'] = layout_summary(summarize_materials(section_boms, image_labels), len(section_boms),
+                                                     page_size)
             
-            # Add AC-link images (2 of each per section)
-            images.append({
-                'name': '115x4spectraACLink1.png',
-                'quantity': 2
-            })
-            images.append({
-                'name': '115x4spectraACLink2.png',
-                'quantity': 2
+            # Number pages across the packet now that the whole layout is known
+            packet_pages = plan['front_pages'] + plan['pages']
+            for packet_page, page in enumerate(packet_pages, start=1):
+                page['packet_page'] = packet_page
+                page['packet_pages'] = len(packet_pages)
+            return plan
+
+    def preview_packet(self, form_data):
+        """Summarize the packet generate_pdf would produce, without rendering it.
+        
+        Returns per-section page counts and images, the packet's images with
+        their total quantities, the warnings the render would report and an
+        estimate of the PDF size in bytes.
+        """
+        start_time = time.perf_counter()
+        plan = self.plan_packet(form_data)
+        quality = self.get_quality(form_data)
+        
+        sections = []
+        images = {}
+        for section in plan['sections']:
+            section_images = [{'name': item.name, 'quantity': item.quantity} for item in section['images']]
+            sections.append({
+                'section': section['section'],
+                'section_type': section['section_type'],
+                'pages': section['pages'],
+                'images': section_images
             })
+            for item in section_images:
+                image = images.setdefault(item['name'], {'name': item['name'], 'quantity': 0, 'sections': []})
+                image['quantity'] += item['quantity']
+                image['sections'].append(section['section'])
+        
+        # Every drawing is embedded once however many pages it appears on
+        drawn_images = {item['name'] for page in plan['pages'] for item in page['items'] if item['type'] == 'image'}
+        image_bytes = 0
+        for image_name in drawn_images:
+            try:
+                image_bytes += os.path.getsize(os.path.join(self.images_dir, image_name))
+            except OSError:
+                pass
+        for image in images.values():
+            image['missing'] = not os.path.exists(os.path.join(self.images_dir, image['name']))
+        
+        summary_pages = len(plan['front_pages'])
+        return {
+            'quality': quality,
+            'total_sections': len(sections),
+            'total_pages': summary_pages + len(plan['pages']),
+            'summary_pages': summary_pages,
+            'estimated_bytes': int(ESTIMATED_PACKET_BYTES
+                                   + ESTIMATED_BYTES_PER_PAGE * len(plan['pages'])
+                                   + ESTIMATED_BYTES_PER_SUMMARY_PAGE * summary_pages
+                                   + ESTIMATED_IMAGE_BYTES_RATIO.get(quality, 1.0) * image_bytes),
+            'sections': sections,
+            'images': sorted(images.values(), key=lambda image: image['name']),
+            'warnings': list(dict.fromkeys(plan['warnings'])),
+            'elapsed_ms': round((time.perf_counter() - start_time) * 1000, 2)
+        }
+
+    def build_page_template(self, c, form_data, page_size=letter):
+        """Draw the furniture every page of a packet shares into a form XObject and return its name.
+        
+        The header, rules and project details are the same on every page, so
+        they are drawn once per document and each page only stamps the form.
+        """
+        # Positions are kept relative to the top and right edges so every page size gets the same margins
+        page_width, page_height = page_size
+        right = page_width - 1*inch
+        
+        c.beginForm(PAGE_TEMPLATE_FORM, 0, 0, page_width, page_height)
+        
+        # Add header with packet title
+        c.setFont("Helvetica-Bold", 14)
+        c.drawString(1*inch, page_height - 0.5*inch, "FACTORY SWITCHBOARD PACKET")
+        
+        # Add a horizontal line at the top
+        c.setStrokeColor(colors.gray)
+        c.setLineWidth(0.5)
+        c.line(1*inch, page_height - 0.8*inch, right, page_height - 0.8*inch)
+        
+        # Add project details at bottom right
+        c.setFont("Helvetica", 10)
+        c.drawString(right - 2.5*inch, 1*inch, f"Sales Order: {form_data.get('sales_order', '')}")
+        c.drawString(right - 2.5*inch, 0.7*inch, f"Customer: {form_data.get('customer_name', '')}")
+        c.drawString(right - 2.5*inch, 0.4*inch, f"Job: {form_data.get('job_address', '')}")
+        c.drawString(right - 2.5*inch, 0.1*inch, f"Switchboard: {form_data.get('switchboard_name', '')}")
+        
+        # Add a horizontal line at the bottom
+        c.line(1*inch, 1.2*inch, right, 1.2*inch)
+        
+        c.endForm()
+        return PAGE_TEMPLATE_FORM
+
+    def draw_page_furniture(self, c, form_data, page, template, page_size=letter):
+        """Stamp the page template, then draw what varies per page: the title and page numbers."""
+        page_width, page_height = page_size
+        right = page_width - 1*inch
+        c.doForm(template)
+        
+        # Section title, or the title of a front page such as the material summary
+        c.setFont("Helvetica-Bold", 16)
+        if page.get('title'):
+            c.drawString(1*inch, page_height - 1.2*inch, f"{form_data.get('switchboard_name', '')} - {page['title']}")
+        else:
+            c.drawString(1*inch, page_height - 1.2*inch, f"{form_data.get('switchboard_name', '')} - Section {page['section']}: {page['section_type']}")
+        
+        # Add page numbers: in the packet, and within the section or front matter
+        c.setFont("Helvetica", 8)
+        if 'packet_page' in page:
+            c.drawString(right - 0.5*inch, 0.65*inch, f"Page {page['packet_page']} of {page['packet_pages']}")
+        c.drawString(right - 0.5*inch, 0.5*inch, f"Page {page['page_num']} of {page.get('title') or 'Section ' + str(page['section'])}")
+
+    def render_plan(self, c, plan, form_data, embed_mode=None, progress=None, timer=None, warnings=None):
+        """Draw every page of a page plan onto the canvas.
+        
+        progress, if given, is called as progress(sections_done, total_sections)
+        after the last page of each section has been drawn. timer, a
+        PhaseTimer, collects the time spent loading and drawing images and
+        emitting pages. Images that can't be drawn are logged and, if
+        warnings is a list, appended to it.
+        """
+        timer = timer or PhaseTimer()
+        embed_mode = embed_mode or self.embed_mode
+        shared_forms = {} if embed_mode == 'shared' else None
+        quality = self.get_quality(form_data)
+        page_size = plan.get('page_size', letter)
+        
+        with timer.phase('page'):
+            template = self.build_page_template(c, form_data, page_size)
+        
+        # Front pages (the material summary) come before the sections
+        for page in plan.get('front_pages', ()):
+            self.render_page(c, page, form_data, quality, shared_forms, timer, template, warnings, page_size)
+        
+        total_sections = len(plan['sections'])
+        pages = plan['pages']
+        for index, page in enumerate(pages):
+            self.render_page(c, page, form_data, quality, shared_forms, timer, template, warnings, page_size)
             
-            # Add connection bar stack images based on depth and amperage
-            if depth == '30':
-                images.append({
-                    'name': self.get_connection_bar_stack_image(amperage, '30'),
-                    'quantity': 6
-                })
-            elif depth == '36':
-                images.append({
-                    'name': self.get_connection_bar_stack_image(amperage, '36'),
-                    'quantity': 6
-                })
-            
-            # Add AC phase vertical link (4 per section)
-            images.append({
-                'name': '1225x4spectraACPhaseVerticalLink4in.png',
-                'quantity': 4
-            })
+            # Compact pages aren't tied to a section
+            is_last_page_of_section = page['section'] is not None and (
+                index + 1 == len(pages) or pages[index + 1]['section'] != page['section'])
+            if progress is not None and is_last_page_of_section:
+                progress(page['section'], total_sections)
+        
+        if progress is not None and pages and pages[-1]['section'] is None:
+            # A compact plan covers every section at once
+            progress(total_sections, total_sections)
+
+    def render_page(self, c, page, form_data, quality, shared_forms, timer, template, warnings=None, page_size=letter):
+        """Draw one page of a page plan, with its furniture, and end the page."""
+        with timer.phase('page'):
+            self.draw_page_furniture(c, form_data, page, template, page_size)
+        
+        for item in page['items']:
+            if item['type'] == 'text':
+                with timer.phase('page'):
+                    c.setFont(item['font'], item['font_size'])
+                    c.drawString(item['x'], item['y'], item['text'])
+                continue
             
-            # Add inner steel images for 44" width
-            if width == '44':
-                images.append({
-                    'name': '44375SpectraInnerSteel44Wide.png',
-                    'quantity': 2
-                })
-                images.append({
-                    'name': '44375SpectraInnerSteel44WideSideView.png',
-                    'quantity': 1
-                })
-        
-        return images
-    
-    def get_quantity_for_amperage(self, amperage, is_abc=False):
-        """Get quantity based on amperage."""
-        base_quantity = 1
-        if amperage == '4000':
-            base_quantity = 4
-        elif amperage in ['3000', '2500']:
-            base_quantity = 3
-        elif amperage in ['2000', '1200']:
-            base_quantity = 2
-        elif amperage == '1000':
-            base_quantity = 1
-        
-        # For horizontal ABC bus only, multiply by 3
-        if is_abc:
-            return base_quantity * 3
-        return base_quantity
-    
-    def get_connection_bar_stack_image(self, amperage, depth):
-        """Get connection bar stack image based on amperage and depth."""
-        if depth == '30':
-            if amperage == '4000':
-                return '675x4SpectraHorizontalConnection4BarStack30deep.png'
-            elif amperage in ['3000', '2500']:
-                return '725x4SpectraHorizontalConnection3BarStack30deep.png'
-            elif amperage in ['2000', '1200']:
-                return '775x4SpectraHorizontalConnection2BarStack30deep.png'
-            elif amperage == '1000':
-                return '825x4SpectraHorizontalConnection1BarStack30Deep.png'
-            else:
-                return '825x4SpectraHorizontalConnection1BarStack30Deep.png'
-        elif depth == '36':
-            if amperage == '4000':
-                return '1275x4SpectraHorizontalConnection4BarStack36deep.png'
-            elif amperage in ['3000', '2500']:
-                return '1325x4SpectraHorizontalConnection3BarStack36deep.png'
-            elif amperage in ['2000', '1200']:
-                return '1375x4SpectraHorizontalConnection2BarStack36deep.png'
-            elif amperage == '1000':
-                return '1425x4SpectraHorizontalConnection1BarStack36deep.png'
-            else:
-                return '1425x4SpectraHorizontalConnection1BarStack36deep.png'
+            try:
+                with timer.phase('image_load'):
+                    cached_image = self.image_cache.get(self.image_variants.get_path(item['name'], quality))
+                with timer.phase('draw_image'):
+                    self.draw_image(c, item['name'], cached_image, item['x'], item['y'],
+                                    item['width'], item['height'], shared_forms)
+            except Exception as e:
+                warning = f"Error adding image {item['name']} for section {page['section']}: {str(e)}"
+                logger.warning(warning)
+                if warnings is not None:
+                    warnings.append(warning)
+        
+        with timer.phase('page'):
+            c.showPage()
+
+    def split_plan(self, plan, max_fragments):
+        """Split a page plan into at most max_fragments plans of consecutive sections.
+        
+        Sections are grouped rather than rendered one per fragment because every
+        fragment has to embed its own copy of each drawing it uses. The first
+        fragment also carries the plan's front pages.
+        """
+        sections = []
+        for section_number, pages in groupby(plan['pages'], key=lambda page: page['section']):
+            section = next(s for s in plan['sections'] if s['section'] == section_number)
+            sections.append((section, list(pages)))
+        
+        # Balance fragments by page count
+        pages_per_fragment = len(plan['pages']) / max(1, min(max_fragments, len(sections)))
+        fragments = []
+        fragment = None
+        for section, pages in sections:
+            if fragment is None or (len(fragment['pages']) >= pages_per_fragment and len(fragments) < max_fragments):
+                fragment = {'pages': [], 'sections': [], 'warnings': [], 'page_size': plan['page_size']}
+                fragments.append(fragment)
+            fragment['pages'].extend(pages)
+            fragment['sections'].append(section)
+        if fragments:
+            fragments[0]['front_pages'] = plan.get('front_pages', [])
+        return fragments
+
+    def _get_section_pool(self):
+        # Started on first use so forked web workers each get their own pool. Workers
+        # are spawned, not forked: the web process has threads (job queue, log
+        # listener) whose locks a forked child could inherit held.
+        with self._section_pool_lock:
+            if self._section_pool is None:
+                self._section_pool = ProcessPoolExecutor(max_workers=self.section_workers,
+                                                         mp_context=multiprocessing.get_context('spawn'))
+            return self._section_pool
 
-    def generate_pdf(self, form_data):
+    def render_plan_parallel(self, plan, form_data, output, embed_mode=None, progress=None, timer=None,
+                             warnings=None):
+        """Render groups of sections in worker processes and merge the fragments in section order."""
+        timer = timer or PhaseTimer()
+        fragments = self.split_plan(plan, self.section_workers)
+        executor = self._get_section_pool()
+        futures = [executor.submit(_render_fragment, fragment, form_data, embed_mode) for fragment in fragments]
+        
+        pdfs = []
+        total_sections = len(plan['sections'])
+        with timer.phase('render_fragments'):
+            for fragment, future in zip(fragments, futures):
+                pdf, fragment_warnings = future.result()
+                pdfs.append(pdf)
+                for warning in fragment_warnings:
+                    logger.warning(warning)
+                if warnings is not None:
+                    warnings.extend(fragment_warnings)
+                if progress is not None:
+                    progress(fragment['sections'][-1]['section'], total_sections)
+        
+        with timer.phase('merge'):
+            merge_pdfs(pdfs, output)
+
+    def generate_pdf(self, form_data, embed_mode=None, output=None, progress=None, parallel=None, warnings=None):
+        """Render a packet to output, a path or a binary file object.
+        
+        form_data is the packet form's fields, a JSON board definition or a
+        Switchboard (see utils.switchboard). With no output the packet is written to a new temporary file and its
+        path is returned; the caller is responsible for deleting it. progress
+        is passed through to render_plan. parallel renders sections on a
+        process pool (default: self.parallel_sections). If warnings is a
+        list, the packet's warnings (missing images, page limits) are
+        appended to it.
+        """
         start_time = time.time()
         
-        # Create a temporary file instead of saving to output directory
-        import tempfile
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        pdf_path = temp_file.name
-        temp_file.close()
+        temp_path = None
+        if output is None:
+            # Create a temporary file instead of saving to output directory
+            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
+            temp_path = temp_file.name
+            temp_file.close()
+            output = temp_path
         
+        timer = PhaseTimer()
         try:
-            # Create PDF
-            c = canvas.Canvas(pdf_path, pagesize=letter)
-            
-            # Get styles
-            styles = getSampleStyleSheet()
-            title_style = ParagraphStyle(
-                'CustomTitle',
-                parent=styles['Heading1'],
-                fontSize=16,
-                spaceAfter=30,
-                alignment=TA_LEFT
-            )
-            
-            normal_style = ParagraphStyle(
-                'CustomNormal',
-                parent=styles['Normal'],
-                fontSize=12,
-                spaceAfter=12
-            )
-            
-            # Get common settings
-            common_depth = form_data.get('common_depth', '')
-            common_height = form_data.get('common_height', '')
-            common_amperage = form_data.get('common_amperage', '')
-            common_bus = form_data.get('common_bus', '')
+            # Parse once; everything downstream reads the Switchboard
+            with timer.phase('parse_form'):
+                form_data = self.get_switchboard(form_data)
+            plan = self.plan_packet(form_data, timer)
+            for warning in plan['warnings']:
+                logger.warning(warning)
+            if warnings is not None:
+                warnings.extend(plan['warnings'])
             
-            # Get total number of sections
-            total_sections = int(form_data.get('num_sections', 0))
+            if parallel is None:
+                parallel = self.parallel_sections
             
-            # Add section details and images
-            for i in range(1, total_sections + 1):
-                section_type = form_data.get(f'section_type_{i}', '')
-                width = form_data.get(f'width_{i}', '')
-                
-                # Get depth value
-                if common_depth == 'no':
-                    depth = form_data.get(f'depth_{i}', '')
-                else:
-                    depth = common_depth
-                
-                # Get height value
-                if common_height == 'no':
-                    height = form_data.get(f'height_{i}', '')
-                else:
-                    height = common_height
-                
-                # Get amperage value
-                if common_amperage == 'no':
-                    amperage = form_data.get(f'amperage_{i}', '')
-                else:
-                    amperage = common_amperage
-                
-                # Get bus size value
-                if common_bus == 'no':
-                    bus_size = form_data.get(f'bus_{i}', '')
-                else:
-                    bus_size = common_bus
-                
-                # Get images for this section
-                section_images = self.get_section_images(i, total_sections, section_type, width, amperage, depth, bus_size)
-                
-                # Start with the first page for this section
-                page_num = 1
-                images_processed = 0
-                max_pages_per_section = 10  # Safety limit to prevent infinite loops
-                pages_created = 0
-                
-                while images_processed < len(section_images) and pages_created < max_pages_per_section:
-                    pages_created += 1
-                    
-                    # Add header with packet title
-                    c.setFont("Helvetica-Bold", 14)
-                    c.drawString(1*inch, 10.5*inch, "FACTORY SWITCHBOARD PACKET")
-                    
-                    # Section title
-                    c.setFont("Helvetica-Bold", 16)
-                    c.drawString(1*inch, 9.8*inch, f"{form_data.get('switchboard_name', '')} - Section {i}: {section_type}")
-                    
-                    # Add a horizontal line at the top
-                    c.setStrokeColor(colors.gray)
-                    c.setLineWidth(0.5)
-                    c.line(1*inch, 10.2*inch, 7.5*inch, 10.2*inch)
-                    
-                    # Add project details at bottom right
-                    c.setFont("Helvetica", 10)
-                    c.drawString(5*inch, 1*inch, f"Sales Order: {form_data.get('sales_order', '')}")
-                    c.drawString(5*inch, 0.7*inch, f"Customer: {form_data.get('customer_name', '')}")
-                    c.drawString(5*inch, 0.4*inch, f"Job: {form_data.get('job_address', '')}")
-                    c.drawString(5*inch, 0.1*inch, f"Switchboard: {form_data.get('switchboard_name', '')}")
-                    
-                    # Add page number
-                    c.setFont("Helvetica", 8)
-                    c.drawString(7*inch, 0.5*inch, f"Page {page_num} of Section {i}")
-                    
-                    # Add a horizontal line at the bottom
-                    c.line(1*inch, 1.2*inch, 7.5*inch, 1.2*inch)
-                    
-                    # Start position for images (reduced gap from section label)
-                    y_position = 9.0*inch
-                    images_on_this_page = 0
-                    
-                    # Add section images if available
-                    while images_processed < len(section_images) and y_position > 2*inch:
-                        img = section_images[images_processed]
-                        image_path = os.path.join(self.images_dir, img['name'])
-                        
-                        # Check if this is a bus size text entry
-                        if img['name'].startswith('Bus Size:'):
-                            # Add bus size text
-                            c.setFont("Helvetica-Bold", 12)
-                            c.drawString(1*inch, y_position - 0.3*inch, img['name'])
-                            y_position -= 0.5*inch
-                            images_processed += 1
-                            images_on_this_page += 1
-                            continue
-                        
-                        if os.path.exists(image_path):
-                            try:
-                                img_reader = ImageReader(image_path)
-                                img_width, img_height = img_reader.getSize()
-                                aspect = img_height / img_width
-                                
-                                # Check if this is an MLO ABC or neutral image
-                                is_mlo_special = any(img['name'].startswith(prefix) for prefix in ['mlo2bar4inch', 'mlo3bar4inch', 'mlo4bar4inch']) and \
-                                               any(suffix in img['name'] for suffix in ['abc.png', 'neutral.png'])
-                                
-                                if is_mlo_special:
-                                    # For MLO ABC and neutral images, use full page
-                                    available_height = 8*inch  # Leave space for header and footer
-                                    available_width = 6.5*inch  # Leave margins
-                                    
-                                    # Calculate dimensions to fit the page while maintaining aspect ratio
-                                    if aspect > available_height/available_width:
-                                        # Height limited
-                                        display_height = available_height
-                                        display_width = display_height / aspect
-                                    else:
-                                        # Width limited
-                                        display_width = available_width
-                                        display_height = display_width * aspect
-                                    
-                                    # Center the image horizontally
-                                    x_position = (8.5*inch - display_width) / 2
-                                    
-                                    # Draw the image
-                                    c.drawImage(img_reader, x_position, y_position - display_height,
-                                              width=display_width, height=display_height, preserveAspectRatio=True)
-                                    
-                                    # Start a new page after each MLO ABC/neutral image
-                                    c.showPage()
-                                    page_num += 1
-                                    
-                                    # Reset y_position for the new page
-                                    y_position = 9.0*inch
-                                    
-                                    # Add header with packet title on new page
-                                    c.setFont("Helvetica-Bold", 14)
-                                    c.drawString(1*inch, 10.5*inch, "FACTORY SWITCHBOARD PACKET")
-                                    
-                                    # Section title
-                                    c.setFont("Helvetica-Bold", 16)
-                                    c.drawString(1*inch, 9.8*inch, f"{form_data.get('switchboard_name', '')} - Section {i}: {section_type}")
-                                    
-                                    # Add a horizontal line at the top
-                                    c.setStrokeColor(colors.gray)
-                                    c.setLineWidth(0.5)
-                                    c.line(1*inch, 10.2*inch, 7.5*inch, 10.2*inch)
-                                    
-                                    # Add project details at bottom right
-                                    c.setFont("Helvetica", 10)
-                                    c.drawString(5*inch, 1*inch, f"Sales Order: {form_data.get('sales_order', '')}")
-                                    c.drawString(5*inch, 0.7*inch, f"Customer: {form_data.get('customer_name', '')}")
-                                    c.drawString(5*inch, 0.4*inch, f"Job: {form_data.get('job_address', '')}")
-                                    c.drawString(5*inch, 0.1*inch, f"Switchboard: {form_data.get('switchboard_name', '')}")
-                                    
-                                    # Add page number
-                                    c.setFont("Helvetica", 8)
-                                    c.drawString(7*inch, 0.5*inch, f"Page {page_num} of Section {i}")
-                                    
-                                    # Add a horizontal line at the bottom
-                                    c.line(1*inch, 1.2*inch, 7.5*inch, 1.2*inch)
-                                    
-                                else:
-                                    # Original image handling for non-MLO ABC/neutral images
-                                    # Calculate maximum display height to ensure at least 2 images per page
-                                    available_height = y_position - 2*inch
-                                    max_display_height = available_height / 2  # Ensure at least 2 images
-                                    
-                                    # Calculate display width based on aspect ratio and max height
-                                    display_height = min(max_display_height, 4*inch)  # Cap at 4 inches
-                                    display_width = display_height / aspect
-                                    
-                                    # Set minimum size constraints
-                                    min_height = 2.5*inch  # Minimum height of 2.5 inches
-                                    min_width = 3*inch     # Minimum width of 3 inches
-                                    
-                                    # If height is too small, adjust both dimensions proportionally
-                                    if display_height < min_height:
-                                        display_height = min_height
-                                        display_width = display_height / aspect
-                                    
-                                    # If width is too small after height adjustment, adjust both dimensions
-                                    if display_width < min_width:
-                                        display_width = min_width
-                                        display_height = display_width * aspect
-                                    
-                                    # If width is too large, scale down proportionally
-                                    if display_width > 6*inch:
-                                        display_width = 6*inch
-                                        display_height = display_width * aspect
-                                    
-                                    # Final check to ensure we don't exceed available space
-                                    if y_position - display_height < 2*inch:
-                                        # Not enough space, start a new page
-                                        break
-                                    
-                                    # Draw the image
-                                    c.drawImage(img_reader, 1*inch, y_position - display_height, 
-                                              width=display_width, height=display_height, preserveAspectRatio=True)
-                                    
-                                    # Add quantity and label under the image
-                                    c.setFont("Helvetica-Bold", 12)
-                                    label = self.image_labels.get(img['name'], img['name'])
-                                    c.drawString(1*inch, y_position - display_height - 0.3*inch, f"QTY: {img['quantity']} - {label}")
-                                    
-                                    # Update y_position for next image
-                                    y_position -= display_height + 0.5*inch
-                                
-                                images_processed += 1
-                                images_on_this_page += 1
-                            except Exception as e:
-                                print(f"Error adding image {img['name']} for section {i}: {str(e)}")
-                                images_processed += 1
-                        else:
-                            print(f"Warning: Image not found: {image_path}")
-                            images_processed += 1
-                    
-                    # If we still have images to process, start a new page
-                    if images_processed < len(section_images):
-                        c.showPage()
-                        page_num += 1
-                    else:
-                        # We're done with this section
-                        c.showPage()
+            # Compact plans aren't split by section; they are short anyway
+            if parallel and len(plan['sections']) > 1 and plan['pages'] and plan['pages'][0]['section'] is not None:
+                mode = 'parallel'
+                self.render_plan_parallel(plan, form_data, output, embed_mode, progress, timer, warnings)
+            else:
+                mode = 'serial'
+                # Create PDF
+                c = canvas.Canvas(output, pagesize=plan['page_size'])
+                self.render_plan(c, plan, form_data, embed_mode, progress, timer, warnings)
                 
-                # Safety check - if we hit the page limit, log a warning
-                if images_processed < len(section_images):
-                    print(f"WARNING: Hit maximum page limit ({max_pages_per_section}) for section {i}. {len(section_images) - images_processed} images not processed.")
-            
-            # Save the PDF
-            c.save()
+                # Save the PDF
+                with timer.phase('save'):
+                    c.save()
             
             elapsed_time = time.time() - start_time
             
-            return pdf_path
+            PACKETS_GENERATED.inc(status='ok')
+            PACKET_SECONDS.observe(elapsed_time, mode=mode)
+            timer.observe(PACKET_PHASE_SECONDS)
+            PACKET_PAGES.observe(len(plan['front_pages']) + len(plan['pages']))
+            PACKET_BYTES.observe(os.path.getsize(output) if isinstance(output, str) else output.tell())
+            
+            return output
             
         except Exception as e:
-            print(f"Error generating PDF: {str(e)}")
-            raise 
\ No newline at end of file
+            PACKETS_GENERATED.inc(status='error')
+            logger.exception("Error generating PDF: %s", e)
+            if temp_path is not None and os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    def generate_pdf_stream(self, form_data, embed_mode=None, spool_threshold=None, parallel=None, warnings=None):
+        """Render a packet into a file object positioned at the start of the PDF.
+        
+        The packet is rendered straight into a SpooledTemporaryFile: up to
+        spool_threshold bytes it stays in memory, beyond that it rolls over to
+        an anonymous temporary file that is removed as soon as it is closed.
+        warnings is passed through to generate_pdf.
+        """
+        if spool_threshold is None:
+            spool_threshold = self.spool_threshold
+        
+        spooled = tempfile.SpooledTemporaryFile(max_size=spool_threshold, suffix='.pdf')
+        try:
+            self.generate_pdf(form_data, embed_mode, output=spooled, parallel=parallel, warnings=warnings)
+        except Exception:
+            # Release the buffer (or the rolled-over temp file) now rather than at garbage collection
+            spooled.close()
+            raise
+        spooled.seek(0)
+        return spooled
@@ -0,0 +1,23 @@
+import io
+from pypdf import PdfReader, PdfWriter
+
+
+def merge_pdfs(pdfs, output=None):
+    """Concatenate PDFs given as bytes, in order.
+    
+    Drawings embedded by more than one input are stored once in the result.
+    Writes to output (a path or binary file object) if given, otherwise
+    returns the merged PDF as bytes.
+    """
+    writer = PdfWriter()
+    for pdf in pdfs:
+        writer.append(PdfReader(io.BytesIO(pdf)))
+    writer.compress_identical_objects()
+    
+    if output is not None:
+        writer.write(output)
+        return output
+    
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
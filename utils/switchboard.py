@@ -0,0 +1,134 @@
+"""Switchboard configuration model.
+
+A board is parsed and validated once, from the packet form's flat fields
+(section_type_1, width_1, common_depth, ...) or from a JSON definition, into
+an immutable Switchboard holding a tuple of Sections. Sections with the same
+configuration are interned, so a 40-section lineup of identical sections
+holds one Section object.
+
+A JSON definition gives board-wide defaults at the top level and overrides
+per section:
+
+    {
+        "sales_order": "SO-1001", "customer_name": "...", "job_address": "...",
+        "switchboard_name": "MSB-1", "packet_quality": "print", "packet_contents": "full",
+        "packet_layout": "compact", "page_size": "tabloid",
+        "depth": 30, "height": 90, "amperage": 2000, "bus_size": 4,
+        "sections": [{"section_type": "MLO", "width": 36},
+                     {"section_type": "Spectra", "width": 44, "amperage": 3000}]
+    }
+"""
+from collections import namedtuple
+
+# Per-section settings that can be set board-wide
+SECTION_SETTINGS = ('depth', 'height', 'amperage', 'bus_size')
+
+# Form field prefix for each setting, e.g. bus_3 and common_bus
+FORM_FIELDS = {'depth': 'depth', 'height': 'height', 'amperage': 'amperage', 'bus_size': 'bus'}
+
+# Board-wide fields: the packet header and the packet options
+BOARD_FIELDS = ('sales_order', 'customer_name', 'job_address', 'switchboard_name',
+                'packet_quality', 'packet_contents', 'packet_layout', 'page_size')
+
+# Bound on the intern table, so arbitrary input can't grow it without limit
+MAX_INTERNED_SECTIONS = 4096
+
+_interned_sections = {}
+
+
+class Section(namedtuple('Section', ['section_type', 'width', 'depth', 'height', 'amperage', 'bus_size'])):
+    """One section's configuration. Values are strings, as the form posts them."""
+    __slots__ = ()
+
+    @classmethod
+    def intern(cls, section_type, width, depth, height, amperage, bus_size):
+        """Return the shared Section for this configuration."""
+        section = cls(section_type, width, depth, height, amperage, bus_size)
+        interned = _interned_sections.get(section)
+        if interned is not None:
+            return interned
+        if len(_interned_sections) < MAX_INTERNED_SECTIONS:
+            _interned_sections[section] = section
+        return section
+
+
+class Switchboard(namedtuple('Switchboard', BOARD_FIELDS + ('sections',))):
+    """A board's header fields, packet options and its tuple of Sections, in lineup order."""
+    __slots__ = ()
+
+    @property
+    def total_sections(self):
+        return len(self.sections)
+
+    def numbered_sections(self):
+        """Yield (section_number, section), numbering from 1."""
+        return enumerate(self.sections, start=1)
+
+    def get(self, field, default=None):
+        """Board field lookup with the same signature as the form dict's get."""
+        value = getattr(self, field, None) if field in BOARD_FIELDS else None
+        return default if value is None else value
+
+    @classmethod
+    def from_form(cls, form_data):
+        """Parse the packet form's flat fields.
+
+        A common_<setting> of 'no' means the setting is given per section
+        (depth_1, bus_2, ...); any other value applies to every section.
+        """
+        try:
+            total_sections = int(form_data.get('num_sections', 0) or 0)
+        except ValueError:
+            raise ValueError(f"Invalid number of sections: {form_data.get('num_sections')!r}")
+        if total_sections < 0:
+            raise ValueError(f"Invalid number of sections: {total_sections}")
+
+        common = {setting: str(form_data.get(f'common_{FORM_FIELDS[setting]}', '')) for setting in SECTION_SETTINGS}
+        sections = []
+        for i in range(1, total_sections + 1):
+            settings = {
+                setting: str(form_data.get(f'{FORM_FIELDS[setting]}_{i}', '')) if common[setting] == 'no' else common[setting]
+                for setting in SECTION_SETTINGS
+            }
+            sections.append(Section.intern(str(form_data.get(f'section_type_{i}', '')),
+                                           str(form_data.get(f'width_{i}', '')), **settings))
+        return cls(*board_values(form_data), sections=tuple(sections))
+
+    @classmethod
+    def from_json(cls, data):
+        """Parse a JSON definition with a 'sections' list (see the module docstring)."""
+        section_list = data.get('sections')
+        if not isinstance(section_list, list):
+            raise ValueError("Switchboard definition needs a 'sections' list")
+
+        defaults = {setting: data.get(setting, '') for setting in SECTION_SETTINGS}
+        sections = []
+        for number, section in enumerate(section_list, start=1):
+            if not isinstance(section, dict):
+                raise ValueError(f"Section {number} must be an object")
+            sections.append(Section.intern(
+                text(section.get('section_type', '')), text(section.get('width', '')),
+                **{setting: text(section.get(setting, defaults[setting])) for setting in SECTION_SETTINGS}
+            ))
+        return cls(*board_values(data), sections=tuple(sections))
+
+
+def text(value):
+    """Normalize a JSON value to the form's string encoding (44.0 -> '44')."""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return '' if value is None else str(value)
+
+
+def board_values(data):
+    # Missing fields stay None so get() falls back to the caller's default
+    return tuple(text(data[field]) if field in data else None for field in BOARD_FIELDS)
+
+
+def parse_switchboard(data):
+    """Return a Switchboard for a Switchboard, a JSON definition or form data."""
+    if isinstance(data, Switchboard):
+        return data
+    if isinstance(data.get('sections'), list):
+        return Switchboard.from_json(data)
+    return Switchboard.from_form(data)
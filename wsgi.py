@@ -0,0 +1,20 @@
+"""Production WSGI entry point.
+
+Run with: gunicorn -c gunicorn.conf.py wsgi:app
+
+gunicorn preloads this module in its master process, so the PDFGenerator,
+its BOM table and every decoded drawing, at every packet quality, are built
+once and shared copy-on-write by the forked workers.
+"""
+import gc
+from app import app, pdf_generator
+from utils.image_variants import QUALITY_PROFILES
+
+# The default quality last, so it is the last to be evicted if the image cache is too small for all
+for quality in sorted(QUALITY_PROFILES, key=lambda quality: quality == pdf_generator.default_quality):
+    pdf_generator.preload_images(pdf_generator.get_bom_image_names(), quality)
+
+# Keep the garbage collector from touching (and so copying) the preloaded
+# objects in every worker
+if hasattr(gc, 'freeze'):
+    gc.freeze()